@@ -1,9 +1,23 @@
+import time
+_RUN_START = time.perf_counter()
+
 import streamlit as st
-import numpy as np
-from PIL import Image
-from watermark_utils import WatermarkEmbedder, WatermarkDecoder
-import cv2
+import base64
 import io
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# NumPy, Pillow, OpenCV and watermark_utils are imported inside the functions
+# that need them, so the first page renders before they are loaded.
+
+logger = logging.getLogger("authpixel")
+DECODE_THREADS = os.cpu_count() or 1
+# Total size of the protected images kept for reruns and repeat downloads
+EMBED_CACHE_BYTES = int(os.environ.get("AUTHPIXEL_EMBED_CACHE_MB", "512")) * 2**20
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -39,17 +53,30 @@ translations = {
         "header_protect": "Embed Invisible Watermark",
         "upload_protect": "Upload Image to Protect",
         "privacy_notice": "This service does not store any of your photos or information.",
-        "watermark_limitation": "⚠️ AuthPixel watermarks may be damaged by excessive editing. (Crop: 75%, JPEG: 99%, Resize: 0%)",
+        "watermark_limitation": "⚠️ AuthPixel watermarks may be damaged by excessive editing. (Crop: 75%, JPEG: 99%, Resize: enlargements and ~75% only)",
         "watermark_text_label": "Enter Watermark Text (Max 20 chars, English letters and numbers.)",
         "embed_button": "🔒 Embed Watermark",
         "warning_no_text": "Please enter watermark text.",
         "embedding_spinner": "Embedding watermark...",
         "success_embed": "Watermark embedded successfully!",
         "download_button": "⬇️ Download Protected Image",
+        "format_label": "Output Format",
+        "format_png": "PNG (lossless, fast)",
+        "format_webp": "WebP (lossless, smaller file)",
+        "format_jpeg": "JPEG (smallest file, checked after compression)",
+        "jpeg_verified": "The JPEG was decoded again and still carries your watermark.",
         "header_verify": "Verify & Decode Watermark",
         "upload_verify": "Upload Image to Verify",
         "decode_button": "🔍 Decode Watermark",
         "decoding_spinner": "Decoding...",
+        "cancel_button": "✖️ Cancel",
+        "decode_progress": "Decoding ({})... {:.0%}",
+        "stage_search": "searching the image",
+        "stage_scaled": "checking for a resized copy",
+        "best_so_far": "Best candidate so far: `{}` ({} votes)",
+        "decode_cancelled": "Decoding was cancelled.",
+        "debug_timings": "🛠️ Debug: timing breakdown",
+        "debug_total": "Total: {:.3f}s (stage times are summed over threads and may nest)",
         "success_decode": "Watermark Detected!",
         "hidden_message": "## 🕵️ Hidden Message: `{}`",
         "error_no_watermark": "No watermark detected or decoding failed.",
@@ -66,17 +93,30 @@ translations = {
         "header_protect": "보이지 않는 워터마크 삽입",
         "upload_protect": "보호할 이미지 업로드",
         "privacy_notice": "이 서비스는 고객님의 사진과 정보를 일체 저장하지 않습니다.",
-        "watermark_limitation": "⚠️ AuthPixel의 워터마크는 과도한 편집 시에는 훼손될 수 있습니다. (이미지 자르기: 75%, JPEG 압축: 99%, 사이즈 변경: 0%)",
+        "watermark_limitation": "⚠️ AuthPixel의 워터마크는 과도한 편집 시에는 훼손될 수 있습니다. (이미지 자르기: 75%, JPEG 압축: 99%, 사이즈 변경: 확대 및 약 75% 축소만)",
         "watermark_text_label": "워터마크 텍스트 입력 (최대 20자, 영문+숫자만 입력해주세요)",
         "embed_button": "🔒 워터마크 삽입",
         "warning_no_text": "워터마크 텍스트를 입력해주세요.",
         "embedding_spinner": "워터마크 삽입 중...",
         "success_embed": "워터마크가 성공적으로 삽입되었습니다!",
         "download_button": "⬇️ 보호된 이미지 다운로드",
+        "format_label": "저장 형식",
+        "format_png": "PNG (무손실, 빠름)",
+        "format_webp": "WebP (무손실, 더 작은 파일)",
+        "format_jpeg": "JPEG (가장 작은 파일, 압축 후 검증)",
+        "jpeg_verified": "JPEG 파일을 다시 해독하여 워터마크가 남아 있음을 확인했습니다.",
         "header_verify": "워터마크 검증 및 해독",
         "upload_verify": "검증할 이미지 업로드",
         "decode_button": "🔍 워터마크 해독",
         "decoding_spinner": "해독 중...",
+        "cancel_button": "✖️ 취소",
+        "decode_progress": "해독 중 ({})... {:.0%}",
+        "stage_search": "이미지 검색",
+        "stage_scaled": "크기가 바뀐 사본 확인",
+        "best_so_far": "현재 가장 유력한 후보: `{}` ({}표)",
+        "decode_cancelled": "해독이 취소되었습니다.",
+        "debug_timings": "🛠️ 디버그: 단계별 소요 시간",
+        "debug_total": "전체: {:.3f}초 (단계별 시간은 스레드 합계이며 중첩될 수 있습니다)",
         "success_decode": "워터마크 감지됨!",
         "hidden_message": "## 🕵️ 숨겨진 메시지: `{}`",
         "error_no_watermark": "워터마크가 감지되지 않았거나 해독에 실패했습니다.",
@@ -204,33 +244,117 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# --- Cached Resources ---
+@st.cache_resource
+def get_embedder():
+    """One embedder per process, shared by all sessions (it keeps no per-call state)."""
+    from watermark_utils import WatermarkEmbedder
+    return WatermarkEmbedder()
+
+@st.cache_resource
+def get_decoder():
+    from watermark_utils import WatermarkDecoder
+    return WatermarkDecoder()
+
+@st.cache_resource
+def get_decode_executor():
+    """Background threads for Verify-tab decodes, shared by all sessions."""
+    return ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="decode")
+
+@st.cache_resource
+def get_asset(path, width=None):
+    """
+    Bytes of a static image, read once per process. With width, it is first
+    downscaled to that many pixels wide (twice its display size), so reruns
+    send the browser a few KB instead of the full-size file.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if width is None:
+        return data
+    from PIL import Image
+    image = Image.open(io.BytesIO(data))
+    if image.width <= width:
+        return data
+    fmt = image.format
+    image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    buf = io.BytesIO()
+    image.save(buf, format=fmt)
+    return buf.getvalue()
+
+@st.cache_resource
+def get_base64_of_bin_file(bin_file, width=None):
+    return base64.b64encode(get_asset(bin_file, width)).decode()
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+PREVIEW_WIDTH = 1200  # About twice the column width, for high-DPI screens
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_preview(key, _data):
+    """
+    Small JPEG of the image in _data for st.image, built once per key (the
+    upload digest, or the digest plus text and format for a protected image).
+    Only the embed and decode paths read the full-resolution pixels.
+    """
+    from PIL import Image
+    image = Image.open(io.BytesIO(_data))
+    # thumbnail() lets the JPEG decoder skip straight to a smaller scale
+    image.thumbnail((PREVIEW_WIDTH, PREVIEW_WIDTH * 4))
+    buf = io.BytesIO()
+    image.convert('RGB').save(buf, format='JPEG', quality=85)
+    return buf.getvalue()
+
 # --- Helper Functions ---
-def embed_watermark(image, text):
-    """Embeds invisible watermark into the image."""
+def embed_watermark(image, text, fmt="png"):
+    """Embeds invisible watermark into the image and encodes it as fmt: (bytes, error)."""
+    from image_output import embed_and_encode
     try:
-        # Convert PIL Image to Numpy array (RGB)
-        img_np = np.array(image)
-        
-        embedder = WatermarkEmbedder()
-        
-        # Embed watermark
-        img_encoded_np, error = embedder.embed(img_np, text)
-        
-        if error:
-            return None, error
-        
-        return Image.fromarray(img_encoded_np), None
+        # Reads the PIL image strip by strip; PNG strips are compressed while the
+        # next ones embed, and a JPEG is only returned if it still decodes to text
+        return embed_and_encode(get_embedder(), image, text, fmt, decoder=get_decoder())
     except Exception as e:
         return None, str(e)
 
-def decode_watermark(image):
-    """Decodes invisible watermark from the image."""
+def _bar_share(progress, start, end, stage):
+    """
+    A decoder progress callback that maps one stage's DecodeProgress into
+    [start, end] of the whole decode and calls progress(fraction, stage, update).
+    """
+    if progress is None:
+        return None
+    def report(update):
+        progress(start + (end - start) * min(1.0, update.done / update.total), stage, update)
+    return report
+
+def decode_watermark(image, data=None, progress=None, cancel=None, instrument=None):
+    """
+    Decodes invisible watermark from the image (data: the uploaded file bytes).
+    progress(fraction, stage, DecodeProgress) gets the overall fraction done:
+    the first search fills 70% of the bar and the resize search, if needed,
+    the rest. cancel is passed to the decoder; cancelling raises DecodeCancelled.
+    With an Instrumentation, a decoder that reports into it is used for this call.
+    """
+    import numpy as np
+    from watermark_utils import DecodeCancelled, WatermarkDecoder
     try:
-        # Convert PIL Image to Numpy array (RGB)
-        img_np = np.array(image)
-        
-        decoder = WatermarkDecoder()
-        watermark, error = decoder.decode(img_np)
+        decoder = get_decoder() if instrument is None else WatermarkDecoder(instrument=instrument)
+        if data is not None and image.format == 'JPEG':
+            # Uncropped JPEGs are read straight from their DCT coefficients;
+            # otherwise this falls back to the grid search on the image
+            result = decoder.decode_jpeg(data, pixels=image, progress=_bar_share(progress, 0.0, 0.7, "stage_search"),
+                                         cancel=cancel)
+        else:
+            # Reads a few thin bands (centre first) and widens only until one
+            # text clearly wins; falls back to the full grid search otherwise
+            result = decoder.decode_progressive(image, progress=_bar_share(progress, 0.0, 0.7, "stage_search"),
+                                                cancel=cancel)
+        if result.text is None:
+            # Maybe a resized copy: estimate the scale and decode at the original size
+            result = decoder.decode_scaled(np.asarray(image.convert('RGB')), early_exit=True,
+                                           progress=_bar_share(progress, 0.7, 1.0, "stage_scaled"), cancel=cancel)
+        watermark, error = result.text, result.error
         
         if watermark:
             # Filter out non-printable characters just in case
@@ -241,9 +365,118 @@ def decode_watermark(image):
                 return None, "Decoded data contains no printable text."
         else:
             return None, error if error else "No watermark detected."
+    except DecodeCancelled:
+        raise
     except Exception as e:
         return None, str(e)
 
+class ByteBoundedCache:
+    """LRU of bytes values whose total length stays within max_bytes. Thread-safe."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.used -= len(old)
+            self._items[key] = value
+            self.used += len(value)
+            while self.used > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.used -= len(evicted)
+
+@st.cache_resource
+def get_embed_cache():
+    """
+    Protected images per (upload digest, text, format), shared by all sessions.
+    Entries are full-resolution files (tens of MB at 24 MP), so the cache is
+    bounded by total bytes rather than by count; hits share the same bytes.
+    """
+    return ByteBoundedCache(EMBED_CACHE_BYTES)
+
+def embed_upload(digest, text, fmt, data):
+    """(encoded bytes, error) for the upload with this digest; successful results are cached."""
+    from PIL import Image
+    cache = get_embed_cache()
+    key = (digest, text, fmt)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, None
+    encoded, error = embed_watermark(Image.open(io.BytesIO(data)), text, fmt)
+    if encoded is not None:
+        cache.put(key, encoded)
+    return encoded, error
+
+# A cancelled decode raises, so only finished results are cached.
+@st.cache_data(max_entries=128, show_spinner=False)
+def decode_upload(digest, _data, _progress=None, _cancel=None):
+    """
+    (text, error, timings) for the upload with this digest; timings holds the
+    total seconds and the decoder's Instrumentation snapshot. _data is not part
+    of the cache key.
+    """
+    from PIL import Image
+    from watermark_utils import Instrumentation
+    instrument = Instrumentation()
+    start = time.perf_counter()
+    text, error = decode_watermark(Image.open(io.BytesIO(_data)), _data, _progress, _cancel, instrument)
+    return text, error, {'total_s': time.perf_counter() - start, **instrument.snapshot()}
+
+def start_decode(digest, data):
+    """
+    Submits a background decode of the upload and returns its job: a dict with
+    the digest, future, cancel token, and 'progress' (latest (fraction, stage,
+    DecodeProgress), written by the worker thread).
+    """
+    from watermark_utils import CancellationToken
+    job = {'digest': digest, 'cancel': CancellationToken(), 'progress': None}
+    def progress(fraction, stage, update):
+        job['progress'] = (fraction, stage, update)
+    job['future'] = get_decode_executor().submit(decode_upload, digest, data, progress, job['cancel'])
+    return job
+
+def _warm_up_task():
+    """Imports the coder and runs a tiny embed/decode, in a decode thread."""
+    import numpy as np
+    from watermark_utils import WatermarkDecoder, WatermarkEmbedder
+    noise = np.random.default_rng(0).integers(0, 256, (64, 128, 3), dtype=np.uint8)
+    watermarked, _ = WatermarkEmbedder().embed(noise, "Warm")
+    WatermarkDecoder().decode_detailed(watermarked)
+
+@st.cache_resource
+def warm_up():
+    """
+    Set AUTHPIXEL_WARMUP=1 to start every decode thread and load NumPy/OpenCV
+    in the background right after the first page render, so the first real
+    embed or decode does not pay for them. Runs once per process.
+    """
+    executor = get_decode_executor()
+    return [executor.submit(_warm_up_task) for _ in range(DECODE_THREADS)]
+
+@st.cache_resource
+def process_stats():
+    """Script runs and the first run's render time in this process (shared by sessions)."""
+    return {'runs': 0, 'first_render_ms': None}
+
+def cancel_decode():
+    """Cancels and forgets this session's decode job, if any."""
+    job = st.session_state.pop('decode_job', None)
+    if job is not None:
+        job['cancel'].cancel()
+
 # --- Main App Layout ---
 col1, col2 = st.columns([8, 2])
 with col1:
@@ -255,7 +488,7 @@ with col2:
 
 sub_col1, sub_col2 = st.columns([3, 10])
 with sub_col1:
-    st.image("shield_icon.jpg", width=150)
+    st.image(get_asset("shield_icon.jpg", 300), width=150)
 with sub_col2:
     st.markdown(f"### {t['subtitle']}")
 
@@ -270,59 +503,105 @@ with tab1:
     st.caption(t["watermark_limitation"])
     
     if uploaded_file:
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Original Image", use_column_width=True)
+        upload = uploaded_file.getvalue()
+        digest = content_hash(upload)
+        st.image(get_preview(digest, upload), caption="Original Image", use_column_width=True)
         
         watermark_text = st.text_input(t["watermark_text_label"], max_chars=20)
+        output_format = st.selectbox(t["format_label"], ["png", "webp", "jpeg"],
+                                     format_func=lambda fmt: t["format_" + fmt])
         
         if st.button(t["embed_button"]):
             if not watermark_text:
                 st.warning(t["warning_no_text"])
             else:
                 with st.spinner(t["embedding_spinner"]):
-                    watermarked_img, error = embed_watermark(image, watermark_text)
+                    byte_im, error = embed_upload(digest, watermark_text, output_format, upload)
                     
                 if error:
                     st.error(f"Error: {error}")
                 else:
+                    from image_output import FORMATS
+                    output = FORMATS[output_format]
                     st.success(t["success_embed"])
-                    st.image(watermarked_img, caption="Protected Image", use_column_width=True)
-                    
-                    # Convert to bytes for download
-                    buf = io.BytesIO()
-                    watermarked_img.save(buf, format="PNG")
-                    byte_im = buf.getvalue()
+                    if not output.lossless:
+                        st.caption(t["jpeg_verified"])
+                    st.image(get_preview((digest, watermark_text, output_format), byte_im),
+                             caption="Protected Image", use_column_width=True)
                     
                     st.download_button(
                         label=t["download_button"],
                         data=byte_im,
-                        file_name="protected_image.png",
-                        mime="image/png"
+                        file_name=f"protected_image.{output.extension}",
+                        mime=output.mime
                     )
 
 # --- Tab 2: Verify ---
 with tab2:
     st.header(t["header_verify"])
     
-    verify_file = st.file_uploader(t["upload_verify"], type=['png', 'jpg', 'jpeg', 'bmp'], key="verify_upload")
+    verify_file = st.file_uploader(t["upload_verify"], type=['png', 'jpg', 'jpeg', 'bmp', 'webp'], key="verify_upload")
     st.caption(t["privacy_notice"])
     st.caption(t["watermark_limitation"])
     
-    if verify_file:
-        verify_image = Image.open(verify_file)
-        st.image(verify_image, caption="Uploaded Image", use_column_width=True)
+    if not verify_file:
+        cancel_decode()
+    else:
+        upload = verify_file.getvalue()
+        digest = content_hash(upload)
+        st.image(get_preview(digest, upload), caption="Uploaded Image", use_column_width=True)
+        job = st.session_state.get('decode_job')
+        if job is not None and job['digest'] != digest:
+            # A new upload supersedes the running decode
+            cancel_decode()
+            job = None
         
         if st.button(t["decode_button"]):
-            with st.spinner(t["decoding_spinner"]):
-                decoded_text, error = decode_watermark(verify_image)
+            # Re-clicking restarts the decode instead of queueing another one
+            cancel_decode()
+            job = st.session_state.decode_job = start_decode(digest, upload)
+        
+        if job is not None:
+            future = job['future']
+            if not future.done():
+                if st.button(t["cancel_button"]):
+                    cancel_decode()
+                else:
+                    # Poll until done; any click reruns the script and ends this loop
+                    bar = st.progress(0.0, text=t["decoding_spinner"])
+                    best = st.empty()
+                    while not future.done():
+                        if job['progress'] is not None:
+                            fraction, stage, update = job['progress']
+                            bar.progress(fraction, text=t["decode_progress"].format(t[stage], fraction))
+                            if update.text:
+                                best.caption(t["best_so_far"].format(update.text, update.votes))
+                        time.sleep(0.2)
+                    bar.empty()
+                    best.empty()
             
-            if decoded_text:
-                st.success(t["success_decode"])
-                st.markdown(t["hidden_message"].format(decoded_text))
-            elif error and "No watermark detected" not in error:
-                 st.error(f"Error: {error}")
+            if future.done():
+                from watermark_utils import DecodeCancelled  # Loaded by the decode already
+                try:
+                    decoded_text, error, timings = future.result()
+                except DecodeCancelled:
+                    st.info(t["decode_cancelled"])
+                else:
+                    if decoded_text:
+                        st.success(t["success_decode"])
+                        st.markdown(t["hidden_message"].format(decoded_text))
+                    elif error and "No watermark detected" not in error:
+                         st.error(f"Error: {error}")
+                    else:
+                        st.error(t["error_no_watermark"])
+                    
+                    with st.expander(t["debug_timings"]):
+                        st.caption(t["debug_total"].format(timings['total_s']))
+                        st.table([{'stage': name, 'calls': stats['calls'], 'seconds': round(stats['seconds'], 4)}
+                                  for name, stats in timings['stages'].items()])
+                        st.json(timings['counters'])
             else:
-                st.error(t["error_no_watermark"])
+                st.info(t["decode_cancelled"])
         
         st.markdown("---")
         st.markdown(f"### {t['search_google']}")
@@ -332,22 +611,15 @@ with tab2:
 st.markdown("---")
 st.markdown(t["footer"])
 
-import base64
-
-def get_base64_of_bin_file(bin_file):
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
-
 try:
-    img_base64 = get_base64_of_bin_file("mywalletqr.png")
+    img_base64 = get_base64_of_bin_file("mywalletqr.png", 500)
     img_src = f"data:image/png;base64,{img_base64}"
 except FileNotFoundError:
     img_src = "" # Handle case where file is missing
 
 # Load buymeacoffee button image for toggle button
 try:
-    coffee_btn_base64 = get_base64_of_bin_file("buymeacoffee_btn.png")
+    coffee_btn_base64 = get_base64_of_bin_file("buymeacoffee_btn.png", 180)
     coffee_btn_src = f"data:image/png;base64,{coffee_btn_base64}"
 except FileNotFoundError:
     coffee_btn_src = ""
@@ -432,3 +704,17 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
+
+# --- Warm-up and Render Timing ---
+if os.environ.get("AUTHPIXEL_WARMUP") == "1":
+    warm_up()
+
+run_stats = process_stats()
+run_stats['runs'] += 1
+render_ms = (time.perf_counter() - _RUN_START) * 1000
+if run_stats['first_render_ms'] is None:
+    run_stats['first_render_ms'] = render_ms
+logger.info("Script run %d took %.1f ms (first run in this process: %.1f ms)",
+            run_stats['runs'], render_ms, run_stats['first_render_ms'])
+if st.query_params.get("debug"):
+    st.caption(f"Rendered in {render_ms:.1f} ms (first run in this process: {run_stats['first_render_ms']:.1f} ms)")
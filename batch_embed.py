@@ -0,0 +1,227 @@
+"""
+Batch watermarking for ingestion pipelines.
+
+    python batch_embed.py INPUT -o OUTPUT_DIR -t "Owner2025" [--workers N]
+
+INPUT is a directory (searched recursively for images) or a manifest file with
+one input path per line, optionally followed by a tab and a per-image
+watermark text. Outputs are PNGs that mirror the input layout under
+OUTPUT_DIR. Inputs are read and outputs written on I/O threads while a
+process pool decodes, embeds and encodes, so disk and CPU overlap.
+
+Outputs are written to a temporary name and renamed when complete, so an
+interrupted run can simply be started again: images whose output already
+exists are skipped. Every processed image is also logged to
+OUTPUT_DIR/batch_journal.jsonl. OUTPUT_DIR may lie inside INPUT; it is not
+searched for inputs.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from watermark_utils import WatermarkEmbedder
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.webp', '.tif', '.tiff'}
+JOURNAL_NAME = "batch_journal.jsonl"
+
+@dataclass
+class BatchJob:
+    source: Path
+    target: Path
+    text: str
+
+@dataclass
+class BatchStats:
+    total: int = 0
+    done: int = 0
+    skipped: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+    @property
+    def images_per_second(self):
+        return self.done / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self):
+        """Input megabytes processed per second."""
+        return self.bytes_in / 1e6 / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f"{self.done} embedded, {self.skipped} skipped, {self.failed} failed "
+                f"of {self.total} in {self.seconds:.1f}s "
+                f"({self.images_per_second:.2f} images/s, {self.mb_per_second:.2f} MB/s in, "
+                f"{self.bytes_out / 1e6:.1f} MB written)")
+
+def collect_jobs(input_path, output_dir, text):
+    """
+    Jobs for a directory tree or a manifest file (path[<TAB>text] per line).
+    Raises ValueError if two inputs map to the same output, e.g. x.jpg and x.png.
+    """
+    input_path = Path(input_path)
+    output_dir = Path(output_dir)
+
+    if input_path.is_dir():
+        root = input_path
+        # Earlier outputs must not be watermarked again when OUTPUT_DIR is inside INPUT
+        resolved_output = output_dir.resolve()
+        entries = [(p, text) for p in sorted(input_path.rglob('*'))
+                   if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS
+                   and resolved_output not in p.resolve().parents]
+    else:
+        root = input_path.parent
+        entries = []
+        for line in input_path.read_text(encoding='utf-8').splitlines():
+            if not line.strip() or line.startswith('#'):
+                continue
+            path, _, line_text = line.partition('\t')
+            path = Path(path.strip())
+            entries.append((path if path.is_absolute() else root / path, line_text.strip() or text))
+
+    jobs = []
+    for source, job_text in entries:
+        try:
+            relative = source.resolve().relative_to(root.resolve())
+        except ValueError:
+            relative = Path(source.name)
+        jobs.append(BatchJob(source, (output_dir / relative).with_suffix('.png'), job_text))
+
+    sources = {}
+    for job in jobs:
+        if job.target in sources:
+            raise ValueError(f"{sources[job.target]} and {job.source} would both be written to {job.target}; "
+                             f"rename one of them.")
+        sources[job.target] = job.source
+    return jobs
+
+_embedder = None
+
+def _init_worker():
+    global _embedder
+    _embedder = WatermarkEmbedder()
+
+def embed_bytes(data, text, compress_level=6):
+    """Decode image bytes, embed text, return (png_bytes, error). Runs in pool workers."""
+    embedder = _embedder or WatermarkEmbedder()
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        watermarked, error = embedder.embed(np.asarray(image), text)
+        if error:
+            return None, error
+        buf = io.BytesIO()
+        Image.fromarray(watermarked).save(buf, format="PNG", compress_level=compress_level)
+        return buf.getvalue(), None
+    except Exception as e:
+        return None, str(e)
+
+def _write_atomic(target, data):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + '.part')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+def batch_embed(jobs, output_dir, workers=None, resume=True, compress_level=6, progress=None):
+    """
+    Embeds every job and returns BatchStats. With resume=True, jobs whose
+    output already exists are skipped. progress(job, record) is called from the
+    main thread after each processed job.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    stats = BatchStats(total=len(jobs))
+    pending = [job for job in jobs if not (resume and job.target.exists())]
+    stats.skipped = stats.total - len(pending)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as processes, \
+            ThreadPoolExecutor(max_workers=2 * workers) as io_threads, \
+            open(output_dir / JOURNAL_NAME, 'a', encoding='utf-8') as journal:
+
+        # Each I/O thread reads one file, waits for its embed in the process
+        # pool and writes the result, so reads and writes overlap with compute.
+        def run(job):
+            job_start = time.perf_counter()
+            data = job.source.read_bytes()
+            png, error = processes.submit(embed_bytes, data, job.text, compress_level).result()
+            if png is not None:
+                _write_atomic(job.target, png)
+            return {
+                'input': str(job.source),
+                'output': str(job.target),
+                'status': 'error' if error else 'ok',
+                'error': error,
+                'bytes_in': len(data),
+                'bytes_out': len(png) if png else 0,
+                'seconds': round(time.perf_counter() - job_start, 3),
+            }
+
+        futures = {io_threads.submit(run, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {'input': str(job.source), 'output': str(job.target), 'status': 'error',
+                          'error': str(e), 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0}
+            if record['status'] == 'ok':
+                stats.done += 1
+            else:
+                stats.failed += 1
+            stats.bytes_in += record['bytes_in']
+            stats.bytes_out += record['bytes_out']
+            journal.write(json.dumps(record) + '\n')
+            journal.flush()
+            if progress:
+                progress(job, record)
+
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embed an invisible AuthPixel watermark into many images.")
+    parser.add_argument('input', help="Directory of images, or a manifest file (path[<TAB>text] per line)")
+    parser.add_argument('-o', '--output', required=True, help="Output directory for watermarked PNGs")
+    parser.add_argument('-t', '--text', default="", help="Watermark text (max 20 chars) unless set per manifest line")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--no-resume', action='store_true', help="Re-embed images whose output already exists")
+    parser.add_argument('--compress-level', type=int, default=6, choices=range(10), metavar='0-9',
+                        help="PNG compression level (lower is faster, larger)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only print the final summary")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = collect_jobs(args.input, args.output, args.text)
+    except ValueError as e:
+        parser.error(str(e))
+    missing_text = [job for job in jobs if not job.text]
+    if missing_text:
+        parser.error(f"no watermark text for {len(missing_text)} image(s); use --text")
+
+    def progress(job, record):
+        if record['status'] != 'ok':
+            print(f"FAILED {job.source}: {record['error']}", file=sys.stderr)
+        elif not args.quiet:
+            print(f"{job.source} -> {job.target} ({record['seconds']:.2f}s)")
+
+    stats = batch_embed(jobs, args.output, workers=args.workers, resume=not args.no_resume,
+                        compress_level=args.compress_level, progress=progress)
+    print(stats.summary())
+    return 1 if stats.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
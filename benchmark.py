@@ -0,0 +1,246 @@
+"""
+Speed and robustness benchmark for watermark_utils.
+
+    python benchmark.py [--sizes 0.3 2 12 24 50] [--output bench.json] [--compare old.json]
+
+For each synthetic image size, times embed, full decode and early-exit decode
+separately and records peak memory (NumPy/OpenCV arrays, via tracemalloc).
+At one size (--robustness-mp), measures the detection rate under the edits the
+UI talks about: crops, JPEG re-compression and resizing. Results are written as
+JSON; with --compare, regressions against an earlier run are listed and the
+exit status is 1.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from watermark_utils import WatermarkDecoder, WatermarkEmbedder
+
+DEFAULT_SIZES_MP = [0.3, 2, 12, 24, 50]
+TEXT = "AuthPixel2025"
+
+# Each attack maps a watermarked RGB image to (pixels, data). data is the
+# encoded file for attacks that produce one (JPEG), else None, so the decode
+# can take the same path as an uploaded file.
+
+def _crop(keep):
+    """Centered crop keeping `keep` of each side, started off the 8-pixel grid."""
+    def attack(img):
+        h, w = img.shape[:2]
+        y0 = int(h * (1 - keep) / 2) | 3
+        x0 = int(w * (1 - keep) / 2) | 5
+        return np.ascontiguousarray(img[y0:y0 + int(h * keep), x0:x0 + int(w * keep)]), None
+    return attack
+
+def _jpeg(quality):
+    def attack(img):
+        ok, buf = cv2.imencode('.jpg', cv2.cvtColor(img, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return cv2.cvtColor(cv2.imdecode(buf, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB), buf.tobytes()
+    return attack
+
+def _resize(scale):
+    def attack(img):
+        h, w = img.shape[:2]
+        return cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA), None
+    return attack
+
+ATTACKS = {
+    'none': lambda img: (img, None),
+    'crop_90': _crop(0.9),
+    'crop_75': _crop(0.75),
+    'crop_50': _crop(0.5),
+    'jpeg_95': _jpeg(95),
+    'jpeg_85': _jpeg(85),
+    'jpeg_75': _jpeg(75),
+    'jpeg_50': _jpeg(50),
+    'resize_90': _resize(0.9),
+    'resize_75': _resize(0.75),
+    'resize_125': _resize(1.25),
+    'resize_150': _resize(1.5),
+}
+
+def synthetic_image(megapixels, seed=0):
+    """3:2 RGB image with smooth shapes plus fine texture, roughly photo-like."""
+    w = int(round((megapixels * 1e6 * 1.5) ** 0.5))
+    h = int(round(w / 1.5))
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (max(2, h // 64), max(2, w // 64), 3), dtype=np.uint8)
+    img = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 6, (h, w, 1)).astype(np.float32)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+def measure(fn, memory=True, repeat=1):
+    """(result, best seconds of `repeat` runs, peak_mb). Peak memory comes from one extra, traced run."""
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds = min(seconds, time.perf_counter() - start)
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+def bench_performance(megapixels, memory=True, workers=1, repeat=1):
+    img = synthetic_image(megapixels)
+    embedder = WatermarkEmbedder(workers=workers)
+    decoder = WatermarkDecoder(workers=workers)
+
+    (watermarked, error), embed_s, embed_mb = measure(lambda: embedder.embed(img, TEXT), memory, repeat)
+    if error:
+        return {'megapixels': megapixels, 'error': error}
+    full, decode_s, decode_mb = measure(lambda: decoder.decode_detailed(watermarked), memory, repeat)
+    fast, fast_s, fast_mb = measure(lambda: decoder.decode_detailed(watermarked, early_exit=True), memory, repeat)
+
+    return {
+        'megapixels': megapixels,
+        'width': img.shape[1],
+        'height': img.shape[0],
+        'embed_s': round(embed_s, 4),
+        'embed_peak_mb': embed_mb and round(embed_mb, 1),
+        'decode_s': round(decode_s, 4),
+        'decode_peak_mb': decode_mb and round(decode_mb, 1),
+        'decode_early_exit_s': round(fast_s, 4),
+        'decode_early_exit_peak_mb': fast_mb and round(fast_mb, 1),
+        'early_exit_scanned_fraction': round(fast.scanned_fraction, 5),
+        'detected': full.text == TEXT and fast.text == TEXT,
+    }
+
+def app_decode(decoder, image, data=None):
+    """
+    Decode as the app's decode_watermark does: JPEG file bytes (data) through
+    decode_jpeg, anything else through decode_progressive, then the scale
+    search if nothing was found.
+    """
+    if data is not None:
+        result = decoder.decode_jpeg(data, pixels=image)
+    else:
+        result = decoder.decode_progressive(image)
+    if result.text is None:
+        result = decoder.decode_scaled(image, early_exit=True)
+    return result
+
+def bench_robustness(megapixels, trials, attacks=None):
+    """Detection rate and mean decode time per attack, decoding as the app does."""
+    embedder = WatermarkEmbedder()
+    decoder = WatermarkDecoder()
+    names = attacks or list(ATTACKS)
+    hits = {name: 0 for name in names}
+    seconds = {name: 0.0 for name in names}
+
+    for seed in range(trials):
+        watermarked, error = embedder.embed(synthetic_image(megapixels, seed=seed + 1), TEXT)
+        if error:
+            raise RuntimeError(error)
+        for name in names:
+            attacked, data = ATTACKS[name](watermarked)
+            start = time.perf_counter()
+            result = app_decode(decoder, attacked, data)
+            seconds[name] += time.perf_counter() - start
+            hits[name] += result.text == TEXT
+
+    return {
+        'megapixels': megapixels,
+        'trials': trials,
+        'attacks': {name: {'detection_rate': hits[name] / trials,
+                           'mean_decode_s': round(seconds[name] / trials, 4)} for name in names},
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline, tolerance=0.2, floor=0.01):
+    """
+    Human-readable regressions of current vs baseline: slower or bigger by more
+    than tolerance (and by more than floor seconds/MB, to ignore timer noise on
+    small images), or detection lost.
+    """
+    regressions = []
+    base_perf = {row['megapixels']: row for row in baseline.get('performance', [])}
+    for row in current.get('performance', []):
+        old = base_perf.get(row['megapixels'])
+        if not old or 'error' in row or 'error' in old:
+            continue
+        for key in ('embed_s', 'decode_s', 'decode_early_exit_s',
+                    'embed_peak_mb', 'decode_peak_mb', 'decode_early_exit_peak_mb'):
+            if row.get(key) is None or not old.get(key):
+                continue
+            if row[key] > old[key] * (1 + tolerance) and row[key] - old[key] > floor:
+                regressions.append(f"{row['megapixels']} MP {key}: {old[key]} -> {row[key]}")
+        if old.get('detected') and not row.get('detected'):
+            regressions.append(f"{row['megapixels']} MP: watermark no longer detected")
+
+    old_attacks = baseline.get('robustness', {}).get('attacks', {})
+    for name, stats in current.get('robustness', {}).get('attacks', {}).items():
+        old = old_attacks.get(name)
+        if old and stats['detection_rate'] < old['detection_rate']:
+            regressions.append(f"{name} detection rate: {old['detection_rate']:.2f} -> {stats['detection_rate']:.2f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark AuthPixel embed/decode speed, memory and robustness.")
+    parser.add_argument('--sizes', type=float, nargs='+', default=DEFAULT_SIZES_MP, help="Image sizes in megapixels")
+    parser.add_argument('--robustness-mp', type=float, default=2, help="Image size for the attack suite")
+    parser.add_argument('--trials', type=int, default=3, help="Images per attack")
+    parser.add_argument('--workers', type=int, default=1, help="workers= for embedder/decoder timing")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per measurement (best is kept)")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the traced peak-memory runs")
+    parser.add_argument('--output', default='bench.json', help="Where to write the JSON results")
+    parser.add_argument('--compare', help="Earlier results JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown/growth before flagging")
+    args = parser.parse_args(argv)
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'workers': args.workers,
+            'repeat': args.repeat,
+        },
+        'performance': [],
+    }
+
+    for mp in args.sizes:
+        row = bench_performance(mp, memory=not args.no_memory, workers=args.workers,
+                                repeat=args.repeat)
+        results['performance'].append(row)
+        print(json.dumps(row))
+
+    results['robustness'] = bench_robustness(args.robustness_mp, args.trials)
+    for name, stats in results['robustness']['attacks'].items():
+        print(f"{name:>12}: detected {stats['detection_rate']:.0%}  ({stats['mean_decode_s']:.3f}s)")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
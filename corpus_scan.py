@@ -0,0 +1,224 @@
+"""
+Scan a folder of (e.g. scraped) images for AuthPixel watermarks.
+
+    python corpus_scan.py CORPUS_DIR [--index authpixel_index.sqlite] [--workers N]
+
+Per-file results (path, size, mtime, SHA-256, decoded text, confidence, time
+spent) are kept in a local SQLite index. On later runs, files whose size and
+mtime are unchanged are skipped. A changed or new file whose content hash is
+already in the index (a copy, a move, a touched file) reuses the stored result
+without any DCT work. Only genuinely new content is decoded, in a process pool.
+"""
+import argparse
+import hashlib
+import io
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from PIL import Image
+
+from batch_embed import IMAGE_EXTENSIONS
+from watermark_utils import WatermarkDecoder
+
+DEFAULT_INDEX = "authpixel_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    text TEXT,
+    confidence REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    seconds REAL NOT NULL DEFAULT 0,
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+"""
+
+@dataclass
+class ScanStats:
+    total: int = 0
+    unchanged: int = 0
+    hash_hits: int = 0
+    decoded: int = 0
+    detected: int = 0
+    failed: int = 0
+    removed: int = 0
+    seconds: float = 0.0
+
+    def summary(self):
+        return (f"{self.total} files: {self.unchanged} unchanged, {self.hash_hits} known by hash, "
+                f"{self.decoded} decoded ({self.failed} failed), {self.removed} removed from index; "
+                f"{self.detected} watermarked files found in {self.seconds:.1f}s")
+
+class CorpusIndex:
+    """SQLite index of per-file scan results. Use from one thread only."""
+    def __init__(self, path=DEFAULT_INDEX):
+        self.conn = sqlite3.connect(str(path))
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def stat_of(self, path):
+        """(size, mtime_ns) recorded for path, or None."""
+        return self.conn.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+
+    def known_hashes(self):
+        """sha256 -> (text, confidence, error) for every decoded content in the index."""
+        rows = self.conn.execute("SELECT sha256, text, confidence, error FROM files")
+        return {sha: (text, confidence, error) for sha, text, confidence, error in rows}
+
+    def record(self, path, size, mtime_ns, sha256, text, confidence, error, seconds):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, text, confidence, error, seconds, scanned_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, sha256, text, confidence, error, seconds, time.time()))
+
+    def prune(self, root, seen):
+        """Drop entries under root that were not seen in this scan. Returns how many."""
+        prefix = os.path.join(root, '')
+        stale = [p for (p,) in self.conn.execute("SELECT path FROM files WHERE substr(path, 1, ?) = ?",
+                                                 (len(prefix), prefix)) if p not in seen]
+        self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in stale])
+        return len(stale)
+
+    def matches(self, root=None):
+        """(path, text, confidence) of every watermarked file, optionally under root."""
+        query = "SELECT path, text, confidence FROM files WHERE text IS NOT NULL"
+        args = ()
+        if root:
+            prefix = os.path.join(root, '')
+            query += " AND substr(path, 1, ?) = ?"
+            args = (len(prefix), prefix)
+        return self.conn.execute(query + " ORDER BY path", args).fetchall()
+
+_decoder = None
+
+def _init_worker():
+    global _decoder
+    _decoder = WatermarkDecoder()
+
+def decode_bytes(data):
+    """(text, confidence, error) for encoded image bytes. Runs in pool workers."""
+    decoder = _decoder or WatermarkDecoder()
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format == 'JPEG':
+            result = decoder.decode_jpeg(data, pixels=image)
+        else:
+            result = decoder.decode_progressive(image)
+        return result.text, result.confidence, result.error
+    except Exception as e:
+        return None, 0.0, str(e)
+
+def scan_corpus(root, index_path=DEFAULT_INDEX, workers=None, rescan=False, progress=None):
+    """
+    Scans every image under root and updates the index. Returns ScanStats.
+    With rescan=True, the size/mtime and hash shortcuts are ignored.
+    progress(path, text, confidence, error, how) is called from the calling thread
+    for each file that was not skipped as unchanged; how is 'hash' or 'decoded'.
+    """
+    root = os.path.abspath(root)
+    workers = workers or os.cpu_count() or 1
+    stats = ScanStats()
+    index = CorpusIndex(index_path)
+    start = time.perf_counter()
+
+    seen = set()
+    changed = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if Path(name).suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            seen.add(path)
+            stats.total += 1
+            if not rescan and index.stat_of(path) == (st.st_size, st.st_mtime_ns):
+                stats.unchanged += 1
+            else:
+                changed.append((path, st.st_size, st.st_mtime_ns))
+
+    known = {} if rescan else index.known_hashes()
+    known_lock = threading.Lock()
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as processes, \
+                ThreadPoolExecutor(max_workers=2 * workers) as io_threads:
+
+            # I/O threads read and hash; only unknown content goes to the process pool.
+            # known holds the in-flight Future of content being decoded, so a copy
+            # met later in the same run waits for that result instead of decoding again.
+            def run(path):
+                data = Path(path).read_bytes()
+                sha256 = hashlib.sha256(data).hexdigest()
+                job_start = time.perf_counter()
+                with known_lock:
+                    cached = known.get(sha256)
+                    if cached is None:
+                        known[sha256] = pending = processes.submit(decode_bytes, data)
+                if cached is not None:
+                    return sha256, cached.result() if isinstance(cached, Future) else cached, 0.0, 'hash'
+                return sha256, pending.result(), time.perf_counter() - job_start, 'decoded'
+
+            futures = {io_threads.submit(run, path): (path, size, mtime_ns) for path, size, mtime_ns in changed}
+            for future in as_completed(futures):
+                path, size, mtime_ns = futures[future]
+                try:
+                    sha256, (text, confidence, error), seconds, how = future.result()
+                except OSError as e:
+                    stats.failed += 1
+                    if progress:
+                        progress(path, None, 0.0, str(e), 'decoded')
+                    continue
+                if how == 'hash':
+                    stats.hash_hits += 1
+                else:
+                    stats.decoded += 1
+                    if error and text is None and error != "No watermark detected.":
+                        stats.failed += 1
+                index.record(path, size, mtime_ns, sha256, text, confidence, error, seconds)
+                if progress:
+                    progress(path, text, confidence, error, how)
+
+        stats.removed = index.prune(root, seen)
+        stats.detected = len(index.matches(root))
+    finally:
+        index.close()
+
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a folder of images for AuthPixel watermarks.")
+    parser.add_argument('corpus', help="Directory to scan (recursively)")
+    parser.add_argument('--index', default=DEFAULT_INDEX, help=f"SQLite index file (default: {DEFAULT_INDEX})")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--rescan', action='store_true', help="Decode every file again, ignoring the index")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Do not print per-file progress")
+    args = parser.parse_args(argv)
+
+    def progress(path, text, confidence, error, how):
+        if args.quiet:
+            return
+        if text:
+            print(f"{path}\t{text}\t{confidence:.2f}\t({how})")
+        elif error and error != "No watermark detected.":
+            print(f"FAILED {path}: {error}", file=sys.stderr)
+
+    stats = scan_corpus(args.corpus, args.index, workers=args.workers, rescan=args.rescan, progress=progress)
+    print(stats.summary())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
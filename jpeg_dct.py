@@ -0,0 +1,253 @@
+"""
+Reads quantized DCT coefficients straight from a baseline JPEG bitstream.
+
+The watermark lives in luma DCT coefficient [3,3] of 8x8 blocks. When a
+watermarked image is saved as JPEG without cropping, the encoder's luma
+blocks are exactly the embedding grid. The coefficient can then be read from
+the entropy-coded data, dequantized, with no IDCT, colour conversion or
+re-transform. Only Huffman decoding is needed, and only for as many MCU rows
+as the caller consumes.
+
+Supports baseline and extended sequential Huffman JPEGs (SOF0/SOF1, 8-bit),
+grayscale or YCbCr, any sampling factors, and restart markers. Progressive,
+arithmetic-coded, lossless and RGB/CMYK files raise JPEGUnsupported.
+"""
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Natural (row-major) index of each zigzag position
+ZIGZAG = [
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+]
+
+_SCAN_END = re.compile(rb'\xff(?![\x00\xd0-\xd7])')
+_RESTART = re.compile(rb'\xff[\xd0-\xd7]')
+
+class JPEGUnsupported(ValueError):
+    """The data is not a JPEG this reader can handle; use the pixel path."""
+
+@dataclass
+class _Component:
+    ident: int
+    h: int
+    v: int
+    quant: int
+    dc_table: int = 0
+    ac_table: int = 0
+
+@dataclass
+class JPEGHeader:
+    width: int
+    height: int
+    components: list
+    quant_tables: dict
+    dc_tables: dict = field(default_factory=dict)
+    ac_tables: dict = field(default_factory=dict)
+    restart_interval: int = 0
+    scan_components: list = field(default_factory=list)
+    scan_start: int = 0  # Offset of the first entropy-coded byte
+
+def read_header(data):
+    """Parses markers up to the first scan. Raises JPEGUnsupported."""
+    if data[:2] != b'\xff\xd8':
+        raise JPEGUnsupported("Not a JPEG file.")
+    pos = 2
+    frame = None
+    quant, dc_tables, ac_tables = {}, {}, {}
+    restart_interval = 0
+    adobe_transform = None
+
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise JPEGUnsupported("Corrupt JPEG marker stream.")
+        marker = data[pos + 1]
+        if marker == 0xFF:  # Fill byte
+            pos += 1
+            continue
+        length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        segment = data[pos + 4:pos + 2 + length]
+        pos += 2 + length
+
+        if marker in (0xC0, 0xC1):
+            if segment[0] != 8:
+                raise JPEGUnsupported("Only 8-bit JPEGs are supported.")
+            height = int.from_bytes(segment[1:3], 'big')
+            width = int.from_bytes(segment[3:5], 'big')
+            components = [_Component(segment[6 + 3 * i], segment[7 + 3 * i] >> 4,
+                                     segment[7 + 3 * i] & 15, segment[8 + 3 * i])
+                          for i in range(segment[5])]
+            frame = (width, height, components)
+        elif 0xC2 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            raise JPEGUnsupported("Progressive, lossless and arithmetic-coded JPEGs are not supported.")
+        elif marker == 0xDB:
+            i = 0
+            while i < len(segment):
+                precision, table_id = segment[i] >> 4, segment[i] & 15
+                if precision:
+                    values = np.frombuffer(segment[i + 1:i + 129], dtype='>u2')
+                    i += 129
+                else:
+                    values = np.frombuffer(segment[i + 1:i + 65], dtype=np.uint8)
+                    i += 65
+                quant[table_id] = values.astype(np.float64)
+        elif marker == 0xC4:
+            i = 0
+            while i < len(segment):
+                table_class, table_id = segment[i] >> 4, segment[i] & 15
+                counts = segment[i + 1:i + 17]
+                n = sum(counts)
+                symbols = segment[i + 17:i + 17 + n]
+                (ac_tables if table_class else dc_tables)[table_id] = _huffman_lut(counts, symbols)
+                i += 17 + n
+        elif marker == 0xDD:
+            restart_interval = int.from_bytes(segment[:2], 'big')
+        elif marker == 0xEE and segment[:5] == b'Adobe' and len(segment) >= 12:
+            adobe_transform = segment[11]
+        elif marker == 0xDA:
+            if frame is None:
+                raise JPEGUnsupported("Scan before frame header.")
+            width, height, components = frame
+            if len(components) not in (1, 3):
+                raise JPEGUnsupported("Only grayscale and YCbCr JPEGs are supported.")
+            if len(components) == 3 and (adobe_transform == 0 or
+                                         [c.ident for c in components] == [ord('R'), ord('G'), ord('B')]):
+                raise JPEGUnsupported("RGB-coded JPEGs have no luma channel.")
+            by_id = {c.ident: c for c in components}
+            scan = []
+            for i in range(segment[0]):
+                component = by_id[segment[1 + 2 * i]]
+                component.dc_table = segment[2 + 2 * i] >> 4
+                component.ac_table = segment[2 + 2 * i] & 15
+                scan.append(component)
+            if components[0] not in scan:
+                raise JPEGUnsupported("First scan does not contain luma.")
+            return JPEGHeader(width, height, components, quant, dc_tables, ac_tables,
+                              restart_interval, scan, pos)
+        elif marker == 0xD9:
+            break
+
+    raise JPEGUnsupported("No image data in JPEG.")
+
+def _huffman_lut(counts, symbols):
+    """65536-entry table: next 16 bits -> (code length << 8) | symbol, 0 if invalid."""
+    lut = [0] * 65536
+    code = 0
+    k = 0
+    for length in range(1, 17):
+        for _ in range(counts[length - 1]):
+            span = 1 << (16 - length)
+            start = code << (16 - length)
+            lut[start:start + span] = [(length << 8) | symbols[k]] * span
+            code += 1
+            k += 1
+        code <<= 1
+    return lut
+
+def luma_coefficient_rows(data, u=3, v=3, header=None):
+    """
+    Yields, per luma block row (top to bottom), the dequantized coefficient
+    (u, v) of every luma block in that row as a float64 array of ceil(width / 8)
+    values. Decoding stops when the caller stops iterating.
+    Raises JPEGUnsupported (possibly mid-way, for corrupt data).
+    """
+    header = header or read_header(data)
+    luma = header.components[0]
+    target = ZIGZAG.index(u * 8 + v)
+    scale = header.quant_tables[luma.quant][target]
+
+    max_h = max(c.h for c in header.components)
+    max_v = max(c.v for c in header.components)
+    blocks_x = -(-header.width * luma.h // max_h // 8)
+    blocks_y = -(-header.height * luma.v // max_v // 8)
+
+    scan = header.scan_components
+    if len(scan) == 1:
+        # Non-interleaved: one block per MCU, raster order over the luma plane
+        mcus_x, mcus_y = blocks_x, blocks_y
+        layout = [(luma, 1, 1)]
+    else:
+        mcus_x = -(-header.width // (8 * max_h))
+        mcus_y = -(-header.height // (8 * max_v))
+        layout = [(c, c.h, c.v) for c in scan]
+    luma_h, luma_v = (1, 1) if len(scan) == 1 else (luma.h, luma.v)
+
+    # Entropy-coded data, split at restart markers and unstuffed
+    end = _SCAN_END.search(data, header.scan_start)
+    scan_data = data[header.scan_start:end.start() if end else len(data)]
+    intervals = iter(_RESTART.split(scan_data))
+    interval_mcus = header.restart_interval or mcus_x * mcus_y
+
+    units = []
+    for component, ch, cv in layout:
+        dc_lut = header.dc_tables.get(component.dc_table)
+        ac_lut = header.ac_tables.get(component.ac_table)
+        if dc_lut is None or ac_lut is None:
+            raise JPEGUnsupported("Missing Huffman table.")
+        for by in range(cv):
+            for bx in range(ch):
+                units.append((dc_lut, ac_lut, component is luma, by, bx))
+
+    buf = b''
+    pos = acc = n = 0
+    left = 0  # MCUs left in the current restart interval
+
+    for mcu_y in range(mcus_y):
+        rows = np.zeros((luma_v, mcus_x * luma_h))
+        for mcu_x in range(mcus_x):
+            if left == 0:
+                buf = next(intervals, b'').replace(b'\xff\x00', b'\xff')
+                pos = acc = n = 0
+                left = interval_mcus
+            left -= 1
+            for dc_lut, ac_lut, is_luma, by, bx in units:
+                # DC: only its size matters, the difference itself is skipped
+                while n < 16:
+                    acc = ((acc & 0xFFFF) << 8) | (buf[pos] if pos < len(buf) else 0)
+                    pos += 1
+                    n += 8
+                entry = dc_lut[(acc >> (n - 16)) & 0xFFFF]
+                if not entry:
+                    raise JPEGUnsupported("Corrupt Huffman data.")
+                n -= (entry >> 8) + (entry & 255)
+                while n < 0:
+                    acc = ((acc & 0xFFFF) << 8) | (buf[pos] if pos < len(buf) else 0)
+                    pos += 1
+                    n += 8
+
+                k = 1
+                while k < 64:
+                    while n < 16:
+                        acc = ((acc & 0xFFFF) << 8) | (buf[pos] if pos < len(buf) else 0)
+                        pos += 1
+                        n += 8
+                    entry = ac_lut[(acc >> (n - 16)) & 0xFFFF]
+                    if not entry:
+                        raise JPEGUnsupported("Corrupt Huffman data.")
+                    n -= entry >> 8
+                    run, size = (entry >> 4) & 15, entry & 15
+                    if size == 0:
+                        if run != 15:
+                            break  # End of block
+                        k += 16
+                        continue
+                    k += run
+                    while n < size:
+                        acc = ((acc & 0xFFFF) << 8) | (buf[pos] if pos < len(buf) else 0)
+                        pos += 1
+                        n += 8
+                    n -= size
+                    if k == target and is_luma:
+                        value = (acc >> n) & ((1 << size) - 1)
+                        if value < 1 << (size - 1):
+                            value -= (1 << size) - 1
+                        rows[by, mcu_x * luma_h + bx] = value * scale
+                    k += 1
+
+        for by in range(luma_v):
+            if mcu_y * luma_v + by < blocks_y:
+                yield rows[by, :blocks_x]
@@ -0,0 +1,396 @@
+"""
+Headless HTTP service for embedding and verifying AuthPixel watermarks.
+
+    python service.py serve [--port 8080] [--workers N] [--max-queue 32] [--timeout 30]
+    python service.py loadtest IMAGE [--url http://127.0.0.1:8080] [--concurrency 8] [--requests 200]
+
+Endpoints:
+    POST /embed?text=Owner2025   body: image bytes -> image/png
+    POST /verify                 body: image bytes -> JSON {text, confidence, error};
+                                 422 if the body is not a readable image
+    GET  /metrics                -> JSON counters, latency and queue-wait percentiles
+    GET  /health
+
+Request bodies are read in chunks, with a size cap. "Expect: 100-continue"
+(sent by curl for bodies over 1 MB) is answered before the body is read. Responses are written in
+chunks and wait for the client to drain. The work runs in a bounded process
+pool. At most --max-queue requests may be waiting or running at once. Beyond
+that, the service answers 503 with Retry-After rather than queueing without
+limit. A request that is not answered within --timeout seconds gets a 504.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlsplit
+
+import numpy as np
+
+import batch_embed
+import corpus_scan
+
+CHUNK_SIZE = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+ROUTES = ('/embed', '/verify', '/metrics', '/health')
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None, close=False):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+        self.close = close
+
+def _init_worker():
+    batch_embed._init_worker()
+    corpus_scan._init_worker()
+
+def _timed(fn, *args):
+    """Runs in the pool: (wall-clock start, fn(*args)), so the caller can tell queue wait from work."""
+    return time.time(), fn(*args)
+
+def percentiles(values):
+    """Summary of a sample of durations in seconds, reported in milliseconds."""
+    if not values:
+        return {'n': 0}
+    arr = np.fromiter(values, dtype=float) * 1000
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+    return {'n': len(arr), 'mean_ms': round(float(arr.mean()), 2), 'p50_ms': round(float(p50), 2),
+            'p90_ms': round(float(p90), 2), 'p99_ms': round(float(p99), 2), 'max_ms': round(float(arr.max()), 2)}
+
+class Metrics:
+    """Counters plus the most recent `window` samples of each timing."""
+    def __init__(self, window=10000):
+        self.counts = Counter()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+
+    def count(self, name):
+        self.counts[name] += 1
+
+    def observe(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    def snapshot(self):
+        return {'counts': dict(self.counts),
+                **{name: percentiles(values) for name, values in sorted(self.samples.items())}}
+
+class WatermarkService:
+    def __init__(self, workers=None, max_queue=32, timeout=30.0, max_body_bytes=64 * 1024 * 1024, compress_level=6):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_body_bytes = max_body_bytes
+        self.compress_level = compress_level
+        self.metrics = Metrics()
+        self.pending = 0
+        self.pool = None
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8080):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        return self.server
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- work dispatch -----------------------------------------------------
+
+    def _release(self, _future):
+        self.pending -= 1
+
+    async def run_job(self, fn, *args):
+        """Runs fn(*args) in the pool, or raises HTTPError for back-pressure and timeouts."""
+        if self.pending >= self.max_queue:
+            self.metrics.count('rejected')
+            raise HTTPError(503, "Server busy, retry later.", {'Retry-After': '1'})
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        submitted = time.time()
+        try:
+            future = self.pool.submit(_timed, fn, *args)
+        except BrokenProcessPool:
+            self.pending -= 1
+            raise HTTPError(500, "Worker pool is not available.")
+        # A job that times out while already running keeps its slot until it
+        # really finishes, so the pool is never oversubscribed.
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+
+        try:
+            started, result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self.metrics.count('timeouts')
+            raise HTTPError(504, f"Request took longer than {self.timeout:g}s.")
+        except BrokenProcessPool:
+            raise HTTPError(500, "Worker pool is not available.")
+        self.metrics.observe('queue_wait', max(0.0, started - submitted))
+        self.metrics.observe('work', time.time() - started)
+        return result
+
+    # --- HTTP --------------------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await _respond(writer, 431, _json({'error': "Request headers too large."}), keep_alive=False)
+                    break
+
+                start = time.perf_counter()
+                keep_alive = False
+                path = '?'
+                try:
+                    method, target, version, headers = _parse_head(head)
+                    path = urlsplit(target).path
+                    path = path if path in ROUTES else 'other'
+                    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                    body = await self._read_body(reader, writer, headers)
+                    status, content_type, payload = await self.route(method, target, headers, body)
+                    extra = {}
+                except HTTPError as e:
+                    status, content_type, payload, extra = e.status, 'application/json', _json({'error': e.message}), e.headers
+                    keep_alive = keep_alive and not e.close
+                except Exception as e:
+                    status, content_type, payload, extra = 500, 'application/json', _json({'error': str(e)}), {}
+                    keep_alive = False
+
+                await _respond(writer, status, payload, content_type, extra, keep_alive)
+                self.metrics.count(f'status_{status}')
+                self.metrics.observe(f'latency {path}', time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_body(self, reader, writer, headers):
+        # curl sends "Expect: 100-continue" for bodies over 1 MB and waits a
+        # second for the go-ahead before sending anything
+        expects_continue = headers.get('expect', '').lower() == '100-continue'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            if expects_continue:
+                await _send_continue(writer)
+            body = bytearray()
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                try:
+                    size = int(size_line.split(b';')[0], 16)
+                except ValueError:
+                    raise HTTPError(400, "Malformed chunk size.", close=True)
+                if size == 0:
+                    await reader.readuntil(b'\r\n')
+                    return bytes(body)
+                if len(body) + size > self.max_body_bytes:
+                    raise HTTPError(413, "Request body too large.", close=True)
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, "Malformed Content-Length.", close=True)
+        if length < 0:
+            raise HTTPError(400, "Malformed Content-Length.", close=True)
+        if length > self.max_body_bytes:
+            raise HTTPError(413, "Request body too large.", close=True)
+        if expects_continue and length:
+            await _send_continue(writer)
+        body = bytearray()
+        while len(body) < length:
+            chunk = await reader.read(min(CHUNK_SIZE, length - len(body)))
+            if not chunk:
+                raise HTTPError(400, "Request body ended early.", close=True)
+            body += chunk
+        return bytes(body)
+
+    async def route(self, method, target, headers, body):
+        """(status, content_type, payload bytes) for one request."""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if url.path == '/health' and method == 'GET':
+            return 200, 'application/json', _json({'status': 'ok'})
+
+        if url.path == '/metrics' and method == 'GET':
+            snapshot = self.metrics.snapshot()
+            snapshot.update(pending=self.pending, workers=self.workers, max_queue=self.max_queue)
+            return 200, 'application/json', _json(snapshot)
+
+        if url.path == '/embed' and method == 'POST':
+            text = query.get('text', [headers.get('x-watermark-text', '')])[0]
+            if not text:
+                raise HTTPError(400, "Missing watermark text (?text=...).")
+            if not body:
+                raise HTTPError(400, "Missing image body.")
+            png, error = await self.run_job(batch_embed.embed_bytes, body, text, self.compress_level)
+            if error:
+                raise HTTPError(422, error)
+            return 200, 'image/png', png
+
+        if url.path == '/verify' and method == 'POST':
+            if not body:
+                raise HTTPError(400, "Missing image body.")
+            text, confidence, error = await self.run_job(corpus_scan.decode_bytes, body)
+            if text is None and error != "No watermark detected.":
+                raise HTTPError(422, error)
+            return 200, 'application/json', _json({'text': text, 'confidence': round(confidence, 4), 'error': error})
+
+        if url.path in ROUTES:
+            raise HTTPError(405, "Method not allowed.")
+        raise HTTPError(404, "Not found.")
+
+def _json(obj):
+    return json.dumps(obj).encode('utf-8')
+
+def _parse_head(head):
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.", close=True)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+async def _send_continue(writer):
+    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+    await writer.drain()
+
+async def _respond(writer, status, payload, content_type='application/json', headers=None, keep_alive=True):
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+             f"Content-Type: {content_type}",
+             f"Content-Length: {len(payload)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    view = memoryview(payload)
+    for i in range(0, len(view), CHUNK_SIZE):
+        writer.write(view[i:i + CHUNK_SIZE])
+        await writer.drain()
+    await writer.drain()
+
+async def serve(host, port, **options):
+    service = WatermarkService(**options)
+    server = await service.start(host, port)
+    print(f"Serving on http://{host}:{port} with {service.workers} worker(s), max queue {service.max_queue}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+# --- load test -------------------------------------------------------------
+
+async def _request(reader, writer, method, target, host, body=b''):
+    """Sends one keep-alive request; returns (status, body bytes)."""
+    writer.write((f"{method} {target} HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1'))
+    writer.write(body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    length = 0
+    for line in header_lines:
+        if line.lower().startswith('content-length:'):
+            length = int(line.split(':', 1)[1])
+    return int(status_line.split()[1]), await reader.readexactly(length)
+
+async def load_test(url, image_path, endpoint='verify', text='LoadTest', concurrency=8, requests=200):
+    """Fires `requests` requests over `concurrency` connections and returns a summary dict."""
+    parts = urlsplit(url)
+    host, port = parts.hostname or '127.0.0.1', parts.port or 80
+    body = Path(image_path).read_bytes()
+    target = f"/embed?text={quote(text)}" if endpoint == 'embed' else '/verify'
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for _ in remaining:
+                start = time.perf_counter()
+                status, _ = await _request(reader, writer, 'POST', target, host, body)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, metrics = await _request(reader, writer, 'GET', '/metrics', host)
+    writer.close()
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(requests / elapsed, 2) if elapsed else 0.0,
+        'statuses': dict(statuses),
+        'latency': percentiles(latencies),
+        'server': json.loads(metrics),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AuthPixel embed/verify HTTP service.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_cmd = commands.add_parser('serve', help="Run the service")
+    serve_cmd.add_argument('--host', default='127.0.0.1')
+    serve_cmd.add_argument('--port', type=int, default=8080)
+    serve_cmd.add_argument('-w', '--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    serve_cmd.add_argument('--max-queue', type=int, default=32, help="Requests waiting or running before 503")
+    serve_cmd.add_argument('--timeout', type=float, default=30.0, help="Seconds per request before 504")
+    serve_cmd.add_argument('--max-body-mb', type=float, default=64, help="Largest accepted upload")
+    serve_cmd.add_argument('--compress-level', type=int, default=6, choices=range(10), metavar='0-9',
+                           help="PNG compression level for /embed")
+
+    load_cmd = commands.add_parser('loadtest', help="Load-test a running service")
+    load_cmd.add_argument('image', help="Image file to send with every request")
+    load_cmd.add_argument('--url', default='http://127.0.0.1:8080')
+    load_cmd.add_argument('--endpoint', choices=['verify', 'embed'], default='verify')
+    load_cmd.add_argument('--text', default='LoadTest', help="Watermark text for --endpoint embed")
+    load_cmd.add_argument('-c', '--concurrency', type=int, default=8)
+    load_cmd.add_argument('-n', '--requests', type=int, default=200)
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.host, args.port, workers=args.workers, max_queue=args.max_queue,
+                              timeout=args.timeout, max_body_bytes=int(args.max_body_mb * 1024 * 1024),
+                              compress_level=args.compress_level))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    summary = asyncio.run(load_test(args.url, args.image, args.endpoint, args.text,
+                                    args.concurrency, args.requests))
+    print(json.dumps(summary, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+# The modules live at the repository root, which is not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+TEXT = "AuthPixel2025"
+
+def textured(h, w, seed=0):
+    """Smooth gradients plus mild noise, roughly like a photo."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w]
+    base = np.stack([(x * 0.3 + y * 0.1) % 200, (y * 0.25) % 180, (x * 0.15 + y * 0.2) % 160], axis=-1)
+    return np.clip(base + 30 + rng.normal(0, 6, (h, w, 3)), 0, 255).astype(np.uint8)
+
+def jpeg(image, quality):
+    """An RGB image after a round trip through OpenCV's JPEG encoder."""
+    _, buf = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return cv2.cvtColor(cv2.imdecode(buf, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+@pytest.fixture
+def image():
+    return textured(512, 640)
@@ -0,0 +1,32 @@
+import pytest
+from PIL import Image
+
+from batch_embed import batch_embed, collect_jobs
+from conftest import TEXT, textured
+
+def _save(path, fmt='PNG'):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(textured(256, 320)).save(path, format=fmt)
+
+def test_outputs_mirror_the_input_tree(tmp_path):
+    _save(tmp_path / 'in' / 'a.jpg', 'JPEG')
+    _save(tmp_path / 'in' / 'sub' / 'b.png')
+    jobs = collect_jobs(tmp_path / 'in', tmp_path / 'out', TEXT)
+    assert [job.target for job in jobs] == [tmp_path / 'out' / 'a.png', tmp_path / 'out' / 'sub' / 'b.png']
+
+def test_same_stem_inputs_are_rejected(tmp_path):
+    _save(tmp_path / 'in' / 'x.jpg', 'JPEG')
+    _save(tmp_path / 'in' / 'x.png')
+    with pytest.raises(ValueError, match="would both be written"):
+        collect_jobs(tmp_path / 'in', tmp_path / 'out', TEXT)
+
+def test_output_inside_input_is_not_rescanned(tmp_path):
+    root = tmp_path / 'in'
+    _save(root / 'x.png')
+    stats = batch_embed(collect_jobs(root, root / 'out', TEXT), root / 'out', workers=1)
+    assert stats.done == 1
+    jobs = collect_jobs(root, root / 'out', TEXT)
+    assert [job.source for job in jobs] == [root / 'x.png']
+    stats = batch_embed(jobs, root / 'out', workers=1)
+    assert (stats.done, stats.skipped) == (0, 1)
+    assert not (root / 'out' / 'out').exists()
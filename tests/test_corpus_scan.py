@@ -0,0 +1,45 @@
+import shutil
+
+from PIL import Image
+
+from conftest import TEXT, textured
+from corpus_scan import CorpusIndex, scan_corpus
+from watermark_utils import WatermarkEmbedder
+
+def _corpus(root):
+    root.mkdir()
+    marked, error = WatermarkEmbedder().embed(textured(256, 320), TEXT)
+    assert error is None
+    Image.fromarray(marked).save(root / 'marked.png')
+    Image.fromarray(textured(256, 320, seed=1)).save(root / 'plain.png')
+    return root
+
+def test_duplicates_in_one_run_are_decoded_once(tmp_path):
+    root = _corpus(tmp_path / 'corpus')
+    shutil.copy(root / 'marked.png', root / 'copy.png')
+    hows = {}
+    stats = scan_corpus(root, tmp_path / 'index.sqlite', workers=1,
+                        progress=lambda path, text, confidence, error, how: hows.setdefault(how, []).append(text))
+    assert (stats.total, stats.decoded, stats.hash_hits, stats.detected) == (3, 2, 1, 2)
+    assert hows['hash'] == [TEXT]
+
+def test_index_skips_unchanged_reuses_hashes_and_prunes(tmp_path):
+    root = _corpus(tmp_path / 'corpus')
+    index_path = tmp_path / 'index.sqlite'
+    stats = scan_corpus(root, index_path, workers=1)
+    assert (stats.decoded, stats.detected) == (2, 1)
+
+    stats = scan_corpus(root, index_path, workers=1)
+    assert (stats.total, stats.unchanged, stats.decoded, stats.hash_hits) == (2, 2, 0, 0)
+
+    shutil.copy(root / 'marked.png', root / 'moved.png')
+    (root / 'marked.png').unlink()
+    stats = scan_corpus(root, index_path, workers=1)
+    assert (stats.total, stats.unchanged, stats.hash_hits, stats.decoded, stats.removed) == (2, 1, 1, 0, 1)
+    assert stats.detected == 1
+
+    index = CorpusIndex(index_path)
+    try:
+        assert [(path, text) for path, text, _ in index.matches(str(root))] == [(str(root / 'moved.png'), TEXT)]
+    finally:
+        index.close()
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+from PIL import Image
+
+from conftest import TEXT, textured
+from watermark_utils import CancellationToken, DecodeCancelled, WatermarkDecoder, WatermarkEmbedder
+
+def _jpeg_bytes(image):
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+PATHS = {
+    'detailed': lambda d, img, **kw: d.decode_detailed(img, **kw),
+    'early_exit': lambda d, img, **kw: d.decode_detailed(img, early_exit=True, **kw),
+    'streaming': lambda d, img, **kw: d.decode_streaming(img, strip_height=64, **kw),
+    'progressive': lambda d, img, **kw: d.decode_progressive(img, **kw),
+    'scaled': lambda d, img, **kw: d.decode_scaled(img, **kw),
+    'jpeg': lambda d, img, **kw: d.decode_jpeg(_jpeg_bytes(img), **kw),
+}
+
+@pytest.fixture(scope='module')
+def images():
+    marked, _ = WatermarkEmbedder().embed(textured(400, 480), TEXT)
+    return {'marked': marked, 'unmarked': textured(400, 480, seed=4)}
+
+@pytest.mark.parametrize('path', list(PATHS))
+@pytest.mark.parametrize('after', [1, 3])
+def test_cancel_after_progress_updates(images, path, after):
+    token = CancellationToken()
+    updates = []
+
+    def progress(update):
+        updates.append(update)
+        if len(updates) == after:
+            token.cancel()
+
+    with pytest.raises(DecodeCancelled):
+        PATHS[path](WatermarkDecoder(), images['unmarked'], progress=progress, cancel=token)
+    assert len(updates) == after
+
+@pytest.mark.parametrize('path', list(PATHS))
+@pytest.mark.parametrize('kind', ['marked', 'unmarked'])
+def test_progress_is_monotonic_and_completes(images, path, kind):
+    updates = []
+    PATHS[path](WatermarkDecoder(), images[kind], progress=updates.append)
+    assert updates
+    for before, after in zip(updates, updates[1:]):
+        assert after.done >= before.done and after.total >= before.total
+    assert all(0 < u.done <= u.total for u in updates)
+    assert updates[-1].done == updates[-1].total
+
+def test_cancelled_before_start():
+    token = CancellationToken()
+    token.cancel()
+    with pytest.raises(DecodeCancelled):
+        WatermarkDecoder().decode_detailed(textured(64, 64), cancel=token)
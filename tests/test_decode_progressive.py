@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from conftest import TEXT, textured
+from watermark_utils import WatermarkDecoder, WatermarkEmbedder
+
+@pytest.fixture(scope='module')
+def marked():
+    image, _ = WatermarkEmbedder().embed(textured(1200, 800), TEXT)
+    return image
+
+def test_clean_image_reads_a_few_bands(marked):
+    result = WatermarkDecoder().decode_progressive(marked)
+    assert result.text == TEXT
+    assert result.early_exit
+    assert result.scanned_fraction < 0.05
+    assert 0 < len(result.regions) and result.regions[-1] != (0, marked.shape[0])
+
+def test_regions_are_the_rows_read(marked):
+    decoder = WatermarkDecoder()
+    result = decoder.decode_progressive(marked)
+    h = marked.shape[0]
+    # The centre band comes first
+    y0, y1 = result.regions[0]
+    assert y0 <= h // 2 < y1
+    # Rows outside the listed regions do not affect the result
+    masked = np.zeros_like(marked)
+    for y0, y1 in result.regions:
+        assert 0 <= y0 < y1 <= h
+        masked[y0:y1] = marked[y0:y1]
+    again = decoder.decode_progressive(masked)
+    assert (again.text, again.votes, again.regions) == (result.text, result.votes, result.regions)
+
+def test_unmarked_image_falls_back_to_full_search():
+    image = textured(600, 400, seed=4)
+    result = WatermarkDecoder().decode_progressive(image)
+    assert result.text is None
+    assert result.regions[-1] == (0, image.shape[0])
+    assert len(result.regions) > 1
@@ -0,0 +1,51 @@
+"""The vectorized grid search against the original 64-pass block loop (reference=True)."""
+import numpy as np
+import pytest
+
+from conftest import TEXT, jpeg, textured
+from watermark_utils import WatermarkDecoder, WatermarkEmbedder, coefficient_map, dct_basis, luma
+
+@pytest.fixture(scope='module')
+def marked():
+    image, _ = WatermarkEmbedder().embed(textured(256, 336), TEXT)
+    return image
+
+ATTACKS = {
+    'none': lambda img: img,
+    'crop_3_5': lambda img: np.ascontiguousarray(img[3:, 5:]),
+    'crop_centre': lambda img: np.ascontiguousarray(img[37:220, 61:301]),
+    'jpeg_90': lambda img: jpeg(img, 90),
+    'jpeg_50': lambda img: jpeg(img, 50),
+    'unmarked': lambda img: textured(256, 336, seed=3),
+}
+
+@pytest.mark.parametrize('attack', list(ATTACKS))
+def test_decode_matches_reference(marked, attack):
+    image = ATTACKS[attack](marked)
+    decoder = WatermarkDecoder()
+    assert decoder.decode(image) == decoder.decode(image, reference=True)
+
+def test_bitstreams_match_reference(marked):
+    decoder = WatermarkDecoder()
+    y = luma(jpeg(marked, 70)[5:, 3:]).astype(np.float32)
+    parity = decoder._parity(coefficient_map(y, dct_basis(8, 3, 3)))
+    h, w = y.shape
+    streams = dict(decoder._extract_bitstreams_reference(y))
+    for oy in range(8):
+        for ox in range(8):
+            bits = decoder._band_coefficients(parity, oy, ox, w).ravel()
+            assert np.array_equal(bits, streams[oy * 8 + ox]), (oy, ox)
+
+def _summary(result):
+    return result.text, result.votes, result.total_votes
+
+def test_workers_do_not_change_the_result(marked):
+    attacked = jpeg(marked, 60)[3:, 5:]
+    assert _summary(WatermarkDecoder().decode_detailed(attacked)) == \
+        _summary(WatermarkDecoder(workers=4).decode_detailed(attacked))
+
+def test_streaming_matches_whole_image(marked):
+    attacked = jpeg(marked, 60)
+    decoder = WatermarkDecoder()
+    assert _summary(decoder.decode_detailed(attacked)) == \
+        _summary(decoder.decode_streaming(attacked, strip_height=64))
@@ -0,0 +1,31 @@
+import cv2
+import pytest
+
+from conftest import TEXT, textured
+from watermark_utils import WatermarkDecoder, WatermarkEmbedder
+
+@pytest.fixture(scope='module')
+def marked():
+    image, _ = WatermarkEmbedder().embed(textured(1200, 1700), TEXT)
+    return image
+
+@pytest.mark.parametrize('scale', [0.75, 1.25, 1.5, 2.0])
+def test_detects_resized_copies(marked, scale):
+    resized = cv2.resize(marked, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    result = WatermarkDecoder().decode_scaled(resized, early_exit=True)
+    assert result.text == TEXT
+    assert result.scale == pytest.approx(scale, rel=0.01)
+
+@pytest.mark.parametrize('scale, interpolation', [(0.95, cv2.INTER_AREA), (1.05, cv2.INTER_AREA),
+                                                  (0.85, cv2.INTER_AREA), (1.25, cv2.INTER_LINEAR)])
+def test_never_reports_a_misread(marked, scale, interpolation):
+    resized = cv2.resize(marked, None, fx=scale, fy=scale, interpolation=interpolation)
+    result = WatermarkDecoder().decode_scaled(resized, early_exit=True)
+    assert result.text in (None, TEXT)
+    if result.text is None:
+        assert result.error == "No watermark detected."
+
+def test_unmarked_image_skips_the_full_decode():
+    result = WatermarkDecoder().decode_scaled(textured(1200, 1700, seed=5), early_exit=True)
+    assert result.text is None
+    assert result.offsets_tried == 0
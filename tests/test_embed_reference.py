@@ -0,0 +1,44 @@
+"""The vectorized embed against the original per-block loop (reference=True)."""
+import cv2
+import numpy as np
+import pytest
+
+from conftest import TEXT, textured
+from watermark_utils import WatermarkEmbedder
+
+def _images():
+    rng = np.random.default_rng(7)
+    noise = rng.integers(0, 256, (203, 333, 3), dtype=np.uint8)
+    return {
+        'random': noise,
+        'flat': np.full((200, 320, 3), 128, dtype=np.uint8),
+        'saturated': np.full((200, 320, 3), 252, dtype=np.uint8),
+        'blurred': cv2.GaussianBlur(noise, (0, 0), 3),
+        'textured': textured(250, 331),
+    }
+
+@pytest.mark.parametrize('name', list(_images()))
+def test_embed_matches_reference(name):
+    image = _images()[name]
+    embedder = WatermarkEmbedder()
+    fast, error = embedder.embed(image.copy(), TEXT)
+    assert error is None
+    reference, _ = embedder.embed(image.copy(), TEXT, reference=True)
+    assert np.array_equal(fast, reference)
+
+def test_workers_do_not_change_the_output():
+    image = textured(600, 500)
+    single, _ = WatermarkEmbedder().embed(image.copy(), TEXT)
+    parallel, _ = WatermarkEmbedder(workers=4).embed(image.copy(), TEXT)
+    assert np.array_equal(single, parallel)
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_streaming_matches_whole_image(workers):
+    image = textured(600, 500)
+    expected, _ = WatermarkEmbedder().embed(image.copy(), TEXT)
+    streamer = WatermarkEmbedder(workers=workers)
+    out = np.zeros_like(image)
+    streamer.embed_streaming(image, TEXT, out, strip_height=72)
+    assert np.array_equal(out, expected)
+    strips = list(streamer.iter_embed_streaming(image, TEXT, strip_height=100))
+    assert np.array_equal(np.concatenate([strip for _, strip in strips]), expected)
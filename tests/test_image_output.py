@@ -0,0 +1,36 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+import image_output
+from conftest import TEXT
+from image_output import embed_and_encode
+from watermark_utils import WatermarkDecoder, WatermarkEmbedder
+
+def _pixels(data):
+    return np.asarray(Image.open(io.BytesIO(data)).convert('RGB'))
+
+def test_lossless_formats_match_embed(image):
+    embedder = WatermarkEmbedder()
+    expected, _ = embedder.embed(image.copy(), TEXT)
+    for fmt in ('png', 'webp'):
+        data, error = embed_and_encode(embedder, image, TEXT, fmt)
+        assert error is None
+        assert np.array_equal(_pixels(data), expected), fmt
+
+def test_jpeg_output_verifies(image):
+    data, error = embed_and_encode(WatermarkEmbedder(), image, TEXT, 'jpeg')
+    assert error is None
+    assert WatermarkDecoder().decode_jpeg(data).text == TEXT
+
+def test_jpeg_that_loses_the_mark_is_rejected(image, monkeypatch):
+    monkeypatch.setattr(image_output, 'JPEG_QUALITY', 8)
+    data, error = embed_and_encode(WatermarkEmbedder(), image, TEXT, 'jpeg')
+    assert data is None
+    assert "did not survive" in error
+
+def test_errors_are_returned(image):
+    embedder = WatermarkEmbedder()
+    assert embed_and_encode(embedder, image, TEXT, 'gif')[1] == "Unknown output format 'gif'."
+    assert embed_and_encode(embedder, image[:64, :64], TEXT, 'png')[0] is None
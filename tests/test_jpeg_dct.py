@@ -0,0 +1,76 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import textured
+from jpeg_dct import ZIGZAG, JPEGUnsupported, luma_coefficient_rows, read_header
+
+def _pil_jpeg(image, **options):
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, format='JPEG', quality=90, **options)
+    return buf.getvalue()
+
+def _cv2_jpeg(image, *params):
+    _, buf = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 90, *params])
+    return buf.tobytes()
+
+def _decoded_luma(data):
+    """The decoder's own Y plane: YCbCr output skips the colour conversion."""
+    image = Image.open(io.BytesIO(data))
+    if image.mode != 'L':
+        image.draft('YCbCr', image.size)
+        image = image.convert('YCbCr')
+    y = np.asarray(image)
+    return (y if y.ndim == 2 else y[..., 0]).astype(np.float32)
+
+def _check_against_dct(data, u=3, v=3):
+    header = read_header(data)
+    rows = list(luma_coefficient_rows(data, u, v))
+    assert len(rows) == -(-header.height // 8)
+    assert all(len(row) == -(-header.width // 8) for row in rows)
+
+    y = _decoded_luma(data)
+    h_blocks, w_blocks = y.shape[0] // 8, y.shape[1] // 8
+    blocks = y[:h_blocks * 8, :w_blocks * 8].reshape(h_blocks, 8, w_blocks, 8).swapaxes(1, 2)
+    expected = np.array([[cv2.dct(np.ascontiguousarray(blocks[i, j]))[u, v] for j in range(w_blocks)]
+                         for i in range(h_blocks)])
+    read = np.array(rows)[:h_blocks, :w_blocks]
+    step = header.quant_tables[header.components[0].quant][ZIGZAG.index(u * 8 + v)]
+    # The pixels went through a rounded IDCT, so only the quantized value must match
+    assert np.abs(read - expected).max() < step / 2
+    assert np.array_equal(np.rint(expected / step) * step, read)
+    return header
+
+@pytest.mark.parametrize('subsampling, factors', [(0, (1, 1)), (1, (2, 1)), (2, (2, 2))])
+def test_colour_sampling(subsampling, factors):
+    header = _check_against_dct(_pil_jpeg(textured(203, 333), subsampling=subsampling))
+    assert (header.components[0].h, header.components[0].v) == factors
+
+def test_grayscale():
+    header = _check_against_dct(_pil_jpeg(cv2.cvtColor(textured(203, 333), cv2.COLOR_RGB2GRAY)))
+    assert len(header.components) == 1
+
+@pytest.mark.parametrize('interval', [1, 7])
+def test_restart_intervals(interval):
+    header = _check_against_dct(_cv2_jpeg(textured(203, 333), cv2.IMWRITE_JPEG_RST_INTERVAL, interval))
+    assert header.restart_interval == interval
+
+@pytest.mark.parametrize('h, w', [(8, 8), (9, 17), (64, 63), (121, 250)])
+def test_odd_sizes(h, w):
+    _check_against_dct(_pil_jpeg(textured(h, w), subsampling=2))
+
+def test_other_coefficients():
+    data = _pil_jpeg(textured(96, 128))
+    for u, v in [(0, 1), (2, 5), (7, 7)]:
+        _check_against_dct(data, u, v)
+
+def test_progressive_is_unsupported():
+    with pytest.raises(JPEGUnsupported):
+        read_header(_pil_jpeg(textured(64, 64), progressive=True))
+
+def test_not_a_jpeg():
+    with pytest.raises(JPEGUnsupported):
+        read_header(b'\x89PNG\r\n\x1a\n')
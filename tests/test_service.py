@@ -0,0 +1,108 @@
+import asyncio
+import io
+import json
+
+import pytest
+from PIL import Image
+
+from conftest import TEXT, textured
+from service import WatermarkService, load_test
+from watermark_utils import WatermarkEmbedder
+
+def _png(image):
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, format='PNG')
+    return buf.getvalue()
+
+async def _read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.decode('latin-1').split('\r\n')[1:]:
+        name, _, value = line.partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length) if length else b''
+
+def _run(scenario, **options):
+    async def main():
+        service = WatermarkService(workers=1, **options)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            try:
+                return await scenario(reader, writer)
+            finally:
+                writer.close()
+        finally:
+            await service.close()
+    return asyncio.run(main())
+
+def test_expect_continue_is_answered_before_the_body():
+    marked, _ = WatermarkEmbedder().embed(textured(256, 320), TEXT)
+    body = _png(marked)
+
+    async def scenario(reader, writer):
+        writer.write(f"POST /verify HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+                     f"Expect: 100-continue\r\n\r\n".encode('latin-1'))
+        await writer.drain()
+        interim = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 0.5)
+        writer.write(body)
+        await writer.drain()
+        return interim, await _read_response(reader)
+
+    interim, (status, payload) = _run(scenario)
+    assert interim == b"HTTP/1.1 100 Continue\r\n\r\n"
+    assert status == 200
+    assert json.loads(payload)['text'] == TEXT
+
+def test_oversized_body_is_refused_without_continue():
+    async def scenario(reader, writer):
+        writer.write(b"POST /verify HTTP/1.1\r\nHost: test\r\nContent-Length: 5000\r\n"
+                     b"Expect: 100-continue\r\n\r\n")
+        await writer.drain()
+        return await _read_response(reader)
+
+    status, _ = _run(scenario, max_body_bytes=1000)
+    assert status == 413
+
+def _post(head, body=b''):
+    async def scenario(reader, writer):
+        writer.write(b"POST /verify HTTP/1.1\r\nHost: test\r\n" + head + b"\r\n" + body)
+        await writer.drain()
+        return await _read_response(reader)
+    return scenario
+
+@pytest.mark.parametrize('head, body', [
+    (b"Content-Length: abc\r\n", b''),
+    (b"Content-Length: -5\r\n", b''),
+    (b"Transfer-Encoding: chunked\r\n", b"zz\r\nabc\r\n0\r\n\r\n"),
+])
+def test_malformed_body_framing_is_a_bad_request(head, body):
+    status, payload = _run(_post(head, body))
+    assert status == 400
+    assert 'Malformed' in json.loads(payload)['error']
+
+def test_verify_rejects_a_body_that_is_not_an_image():
+    body = b"not an image"
+    status, payload = _run(_post(f"Content-Length: {len(body)}\r\n".encode('latin-1'), body))
+    assert status == 422
+    assert json.loads(payload)['error']
+
+def test_unmarked_image_verifies_without_text():
+    body = _png(textured(256, 320))
+    status, payload = _run(_post(f"Content-Length: {len(body)}\r\n".encode('latin-1'), body))
+    assert status == 200
+    assert json.loads(payload) == {'text': None, 'confidence': 0.0, 'error': "No watermark detected."}
+
+def test_load_test_quotes_the_text(tmp_path):
+    image_path = tmp_path / 'photo.png'
+    image_path.write_bytes(_png(textured(256, 320)))
+
+    async def scenario(reader, writer):
+        port = writer.get_extra_info('peername')[1]
+        return await asyncio.wait_for(load_test(f"http://127.0.0.1:{port}", image_path, endpoint='embed',
+                                                text="Owner 2025 & co", concurrency=1, requests=2), 10)
+
+    assert _run(scenario)['statuses'] == {200: 2}
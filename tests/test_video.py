@@ -0,0 +1,42 @@
+import cv2
+import pytest
+
+import video
+from conftest import TEXT, textured
+
+def _write_clip(path, frames=6, size=(240, 320)):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*video.DEFAULT_FOURCC), 10, size[::-1])
+    if not writer.isOpened():
+        pytest.skip(f"OpenCV cannot write {video.DEFAULT_FOURCC} here")
+    for i in range(frames):
+        writer.write(cv2.cvtColor(textured(*size, seed=i), cv2.COLOR_RGB2BGR))
+    writer.release()
+
+def test_embed_then_verify(tmp_path):
+    _write_clip(tmp_path / 'in.avi')
+    stats = video.embed_video(tmp_path / 'in.avi', tmp_path / 'out.avi', TEXT, workers=2)
+    assert stats.frames == 6
+    verdict = video.verify_video(tmp_path / 'out.avi', samples=6, agree=3)
+    assert verdict.text == TEXT
+
+class _DroppingWriter:
+    """A VideoWriter that opens but never stores a frame, as with a broken codec."""
+    def __init__(self, path, fourcc, fps, size):
+        self._writer = _RealWriter(str(path), fourcc, fps, size)
+
+    def isOpened(self):
+        return self._writer.isOpened()
+
+    def write(self, frame):
+        pass
+
+    def release(self):
+        self._writer.release()
+
+_RealWriter = cv2.VideoWriter
+
+def test_silently_failed_write_is_an_error(tmp_path, monkeypatch):
+    _write_clip(tmp_path / 'in.avi')
+    monkeypatch.setattr(video.cv2, 'VideoWriter', _DroppingWriter)
+    with pytest.raises(ValueError, match="of 6 frames|was not written"):
+        video.embed_video(tmp_path / 'in.avi', tmp_path / 'out.avi', TEXT, workers=1)
@@ -0,0 +1,272 @@
+"""
+Watermark video clips frame by frame, and verify them from a sample of frames.
+
+    python video.py embed INPUT OUTPUT.avi -t "Owner2025" [--workers N] [--fourcc HFYU]
+    python video.py verify INPUT [--samples 24] [--agree 3]
+
+Embedding reads frames from cv2.VideoCapture on the calling thread, embeds
+them in a thread pool and writes them in order with cv2.VideoWriter. At most
+--queue frames are in flight, so memory does not grow with the clip length.
+Every frame has the same resolution, so one cached EmbeddingPlan (packet and
+per-block bit map) serves the whole clip.
+
+Write the output with a lossless codec. Lossy video codecs quantize each
+frame again, and inter-frame codecs (H.264, MPEG-4) also predict blocks from
+other frames, so the coefficient parity is not guaranteed to survive them.
+The default, HuffYUV in AVI, keeps the embedded frames bit-exact and encodes
+several times faster than FFV1 (--fourcc FFV1, about a third smaller files),
+whose encoder otherwise costs more per 1080p frame than the embed itself.
+Transcode for distribution if needed, and run verify on the result. OpenCV
+does not copy audio.
+
+Verification decodes evenly spaced frames and stops as soon as --agree of
+them give the same text. Frames in between are skipped with grab() rather
+than seeking: OpenCV's seek decodes forward from an earlier keyframe (often
+the first frame) anyway, so repeated seeks would cost more than one pass.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from watermark_utils import WatermarkDecoder, WatermarkEmbedder
+
+DEFAULT_FOURCC = "HFYU"
+
+@dataclass
+class VideoStats:
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    frames: int = 0
+    seconds: float = 0.0
+
+    @property
+    def frames_per_second(self):
+        return self.frames / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f"{self.frames} frames ({self.width}x{self.height}) embedded in {self.seconds:.1f}s "
+                f"({self.frames_per_second:.1f} frames/s)")
+
+@dataclass
+class VideoVerdict:
+    text: Optional[str] = None
+    frames_checked: int = 0
+    frames_agreeing: int = 0
+    frame_count: int = 0  # As reported by the container; 0 if unknown
+    votes: dict = field(default_factory=dict)  # Decoded text -> frames
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+def _open(source):
+    capture = cv2.VideoCapture(str(source))
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video {source}.")
+    return capture
+
+def embed_video(source, target, text, workers=None, queue_size=None, fourcc=DEFAULT_FOURCC, progress=None):
+    """
+    Embeds text into every frame of source and writes target. Returns VideoStats.
+    Raises ValueError if the video cannot be read or written, or the text does
+    not fit the frame size. progress(stats) is called after each written frame.
+    VideoWriter.write reports nothing, so target is reopened afterwards and
+    must hold every frame.
+    """
+    workers = workers or os.cpu_count() or 1
+    queue_size = queue_size or 2 * workers
+    capture = _open(source)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    w = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    embedder = WatermarkEmbedder()
+    # Checks the text once and caches the plan every frame's embed will reuse
+    _, error = embedder.plan(text, h, w)
+    if error:
+        capture.release()
+        raise ValueError(error)
+    writer = cv2.VideoWriter(str(target), cv2.VideoWriter_fourcc(*fourcc), fps, (w, h))
+    if not writer.isOpened():
+        capture.release()
+        raise ValueError(f"Cannot write {target} with codec {fourcc}.")
+
+    def embed_frame(frame):
+        # The frame buffer is converted in place and reused for the output
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+        watermarked, error = embedder.embed(frame, text)
+        if error:
+            raise ValueError(error)
+        return cv2.cvtColor(watermarked, cv2.COLOR_RGB2BGR, dst=frame)
+
+    stats = VideoStats(width=w, height=h, fps=fps)
+    start = time.perf_counter()
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def write_oldest():
+                writer.write(pending.popleft().result())
+                stats.frames += 1
+                stats.seconds = time.perf_counter() - start
+                if progress:
+                    progress(stats)
+
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                if frame.shape[:2] != (h, w):
+                    raise ValueError("Frame size changes within the video.")
+                pending.append(pool.submit(embed_frame, frame))
+                if len(pending) >= queue_size:
+                    write_oldest()
+            while pending:
+                write_oldest()
+    finally:
+        for future in pending:
+            future.cancel()
+        capture.release()
+        writer.release()
+
+    stats.seconds = time.perf_counter() - start
+    if not stats.frames:
+        raise ValueError(f"No frames could be read from {source}.")
+    _check_written(target, stats.frames, fourcc)
+    return stats
+
+def _check_written(target, frames, fourcc):
+    """Raises ValueError unless target opens and holds `frames` frames."""
+    capture = cv2.VideoCapture(str(target))
+    try:
+        if not capture.isOpened():
+            raise ValueError(f"{target} was not written; codec {fourcc} may not work with this container.")
+        written = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if written <= 0:
+            # Length not in the container: at least the first frame must decode
+            written = int(capture.read()[0])
+            if written:
+                return
+        if written != frames:
+            raise ValueError(f"{target} holds {written} of {frames} frames; codec {fourcc} may not work "
+                             f"with this container.")
+    finally:
+        capture.release()
+
+def _sample_frames(capture, samples):
+    """Yields (index, BGR frame) for up to `samples` frames spread over the clip, in order."""
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    wanted = None
+    if frame_count > 0:
+        wanted = set(np.linspace(0, frame_count - 1, samples).round().astype(int).tolist())
+    # Length unknown (e.g. a stream): one frame per second of video
+    stride = max(1, round(capture.get(cv2.CAP_PROP_FPS) or 1))
+    index = taken = 0
+    while taken < samples and capture.grab():
+        if index in wanted if wanted is not None else index % stride == 0:
+            ok, frame = capture.retrieve()
+            if ok:
+                taken += 1
+                yield index, frame
+        index += 1
+
+def verify_video(source, samples=24, agree=3, workers=None):
+    """
+    Decodes up to `samples` evenly spaced frames, `workers` at a time, and stops
+    once `agree` frames give the same text. Returns a VideoVerdict; raises
+    ValueError if the video cannot be opened.
+    """
+    workers = workers or os.cpu_count() or 1
+    decoder = WatermarkDecoder()
+    capture = _open(source)
+    verdict = VideoVerdict(frame_count=max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT))))
+    agree = max(1, min(agree, samples))
+    votes = Counter()
+    start = time.perf_counter()
+
+    def decode_frame(frame):
+        return decoder.decode_detailed(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), early_exit=True).text
+
+    def collect():
+        text = pending.popleft().result()
+        verdict.frames_checked += 1
+        if text:
+            votes[text] += 1
+
+    def decided():
+        return bool(votes) and votes.most_common(1)[0][1] >= agree
+
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _, frame in _sample_frames(capture, samples):
+                pending.append(pool.submit(decode_frame, frame))
+                if len(pending) >= workers:
+                    collect()
+                    if decided():
+                        break
+            while pending and not decided():
+                collect()
+    finally:
+        for future in pending:
+            future.cancel()
+        capture.release()
+
+    verdict.votes = dict(votes)
+    verdict.seconds = time.perf_counter() - start
+    if votes:
+        verdict.text, verdict.frames_agreeing = votes.most_common(1)[0]
+    if verdict.frames_agreeing < agree:
+        verdict.text = None
+        verdict.error = (f"No text was decoded from {agree} of {verdict.frames_checked} sampled frames."
+                         if verdict.frames_checked else "Could not read any frames.")
+    return verdict
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watermark or verify video clips with AuthPixel.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    embed_cmd = commands.add_parser('embed', help="Embed a watermark into every frame")
+    embed_cmd.add_argument('input', help="Video file to read")
+    embed_cmd.add_argument('output', help="Video file to write (.avi for HFYU, .mkv for FFV1)")
+    embed_cmd.add_argument('-t', '--text', required=True, help="Watermark text (max 20 chars)")
+    embed_cmd.add_argument('-w', '--workers', type=int, default=None, help="Embedding threads (default: CPU count)")
+    embed_cmd.add_argument('--queue', type=int, default=None, help="Frames in flight (default: 2 x workers)")
+    embed_cmd.add_argument('--fourcc', default=DEFAULT_FOURCC,
+                           help=f"Output codec (default: {DEFAULT_FOURCC}, lossless; lossy codecs may destroy the mark)")
+    embed_cmd.add_argument('-q', '--quiet', action='store_true', help="Only print the final summary")
+
+    verify_cmd = commands.add_parser('verify', help="Decode the watermark from sampled frames")
+    verify_cmd.add_argument('input', help="Video file to check")
+    verify_cmd.add_argument('--samples', type=int, default=24, help="Most frames to decode")
+    verify_cmd.add_argument('--agree', type=int, default=3, help="Frames that must give the same text")
+    verify_cmd.add_argument('-w', '--workers', type=int, default=None, help="Decoding threads (default: CPU count)")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'embed':
+            def progress(stats):
+                if not args.quiet and stats.frames % 50 == 0:
+                    print(f"{stats.frames} frames ({stats.frames_per_second:.1f} frames/s)", file=sys.stderr)
+
+            stats = embed_video(args.input, args.output, args.text, workers=args.workers,
+                                queue_size=args.queue, fourcc=args.fourcc, progress=progress)
+            print(stats.summary())
+            return 0
+
+        verdict = verify_video(args.input, samples=args.samples, agree=args.agree, workers=args.workers)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(asdict(verdict), indent=2))
+    return 0 if verdict.text else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
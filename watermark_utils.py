@@ -1,37 +1,390 @@
 import numpy as np
 import cv2
-from collections import Counter
-import re
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Optional
+
+from jpeg_dct import JPEGUnsupported, luma_coefficient_rows, read_header
+
+def dct_basis(block_size, u, v):
+    """
+    Spatial pattern of DCT coefficient (u, v) for an orthonormal block DCT.
+    The coefficient of a block is sum(block * basis); changing it by delta adds delta * basis.
+    """
+    n = np.arange(block_size)
+    scale_u = np.sqrt((1 if u == 0 else 2) / block_size)
+    scale_v = np.sqrt((1 if v == 0 else 2) / block_size)
+    row = scale_u * np.cos((2 * n + 1) * u * np.pi / (2 * block_size))
+    col = scale_v * np.cos((2 * n + 1) * v * np.pi / (2 * block_size))
+    return np.outer(row, col)
+
+def block_view(channel, block_size):
+    """(h_blocks, w_blocks, bs, bs) view of a 2D array whose sides are multiples of block_size."""
+    h, w = channel.shape
+    return channel.reshape(h // block_size, block_size, w // block_size, block_size).swapaxes(1, 2)
+
+def coefficient_map(channel, basis):
+    """
+    Correlation of a 2D channel with a block basis pattern. Entry (y, x) is the
+    coefficient of the block whose top-left corner is (y, x); entries whose block
+    would run past the bottom/right edge are not meaningful.
+    """
+    return cv2.filter2D(channel, cv2.CV_64F, basis, anchor=(0, 0), borderType=cv2.BORDER_CONSTANT)
+
+def luma(rgb):
+    """BT.601 luma (Y) of an RGB uint8 array as a uint8 plane, without building the chroma planes."""
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+
+def row_source(source):
+    """
+    (h, w, read_rows) for an (h, w, 3|4) array, np.memmap or PIL Image, where
+    read_rows(y0, y1) returns rows y0:y1 as an RGB uint8 array.
+    """
+    if hasattr(source, 'crop') and hasattr(source, 'size'):
+        w, h = source.size
+        def read_rows(y0, y1):
+            strip = source.crop((0, y0, w, y1))
+            return np.asarray(strip if strip.mode == 'RGB' else strip.convert('RGB'))
+        return h, w, read_rows
+    h, w = source.shape[:2]
+    return h, w, lambda y0, y1: np.ascontiguousarray(source[y0:y1])
+
+def _ordered_map(fn, items, pool, ahead):
+    """
+    Lazily yields fn(item) in input order. With a pool, keeps up to `ahead`
+    items in flight; without one, runs inline.
+    """
+    if pool is None:
+        yield from map(fn, items)
+        return
+    items = iter(items)
+    pending = deque(pool.submit(fn, item) for _, item in zip(range(ahead), items))
+    while pending:
+        result = pending.popleft().result()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            break
+        yield result
+
+def _pool(workers):
+    """Thread pool for workers > 1 (OpenCV and NumPy release the GIL), else None."""
+    return ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+class Instrumentation:
+    """
+    Per-stage timers and counters, for WatermarkEmbedder(instrument=...) or
+    WatermarkDecoder(instrument=...). Stage times are summed over calls and
+    threads, so with workers > 1 they can exceed wall-clock time. Every
+    observation is also passed to each hook as hook(kind, name, value), where
+    kind is 'time' (value in seconds) or 'count'. Thread-safe.
+    """
+    enabled = True
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.seconds = Counter()
+        self.calls = Counter()
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.seconds[name] += seconds
+            self.calls[name] += 1
+        for hook in self.hooks:
+            hook('time', name, seconds)
+
+    def count(self, name, n=1):
+        n = int(n)
+        with self._lock:
+            self.counters[name] += n
+        for hook in self.hooks:
+            hook('count', name, n)
+
+    def reset(self):
+        with self._lock:
+            self.seconds.clear()
+            self.calls.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """{'stages': {name: {'calls', 'seconds'}}, 'counters': {name: n}}, slowest stage first."""
+        with self._lock:
+            stages = {name: {'calls': self.calls[name], 'seconds': round(seconds, 6)}
+                      for name, seconds in self.seconds.most_common()}
+            return {'stages': stages, 'counters': dict(self.counters)}
+
+    def to_prometheus(self, prefix='authpixel'):
+        """The snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [f'# TYPE {prefix}_stage_seconds_total counter']
+        lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {stats["seconds"]}'
+                  for name, stats in snapshot['stages'].items()]
+        lines.append(f'# TYPE {prefix}_stage_calls_total counter')
+        lines += [f'{prefix}_stage_calls_total{{stage="{name}"}} {stats["calls"]}'
+                  for name, stats in snapshot['stages'].items()]
+        for name, n in sorted(snapshot['counters'].items()):
+            lines += [f'# TYPE {prefix}_{name}_total counter', f'{prefix}_{name}_total {n}']
+        return '\n'.join(lines) + '\n'
+
+class _NoInstrumentation:
+    """Used when instrument=None: stages and counts cost one no-op call."""
+    enabled = False
+    _stage = nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, n=1):
+        pass
+
+_NO_INSTRUMENTATION = _NoInstrumentation()
+
+def text_to_bits(text):
+    """Text as a uint8 array of 0/1 bits, 8 per character (MSB first)."""
+    return np.unpackbits(np.frombuffer(text.encode('latin-1'), dtype=np.uint8))
+
+def bits_from_string(bit_string):
+    return np.frombuffer(bit_string.encode('ascii'), dtype=np.uint8) - ord('0')
+
+@dataclass(frozen=True, eq=False)
+class EmbeddingPlan:
+    """
+    Everything about an embed that depends only on the text and the block grid.
+    Read-only and picklable, so one plan serves every image of that size and
+    can be sent to worker processes.
+    """
+    text: str
+    h_blocks: int
+    w_blocks: int
+    Q: int
+    block_size: int
+    packet: np.ndarray  # [SYNC][MSG][TERMINATOR] bits
+    bits: np.ndarray  # (h_blocks, w_blocks) bit of every block, tiled in raster order
+    basis: np.ndarray  # Spatial pattern of coefficient [3,3]
+
+@lru_cache(maxsize=32)
+def embedding_plan(text, h_blocks, w_blocks, Q, block_size, sync_code):
+    """
+    EmbeddingPlan for this key; the 32 most recently used plans are kept, per
+    process. Raises UnicodeEncodeError for text that is not single-byte (Latin-1).
+    """
+    terminator = np.zeros(8, dtype=np.uint8)
+    packet = np.concatenate([bits_from_string(sync_code), text_to_bits(text), terminator])
+    bits = packet[np.arange(h_blocks * w_blocks) % len(packet)].reshape(h_blocks, w_blocks)
+    basis = dct_basis(block_size, 3, 3)
+    for array in (packet, bits, basis):
+        array.setflags(write=False)
+    return EmbeddingPlan(text, h_blocks, w_blocks, Q, block_size, packet, bits, basis)
 
 class WatermarkEmbedder:
-    def __init__(self):
+    EMBED_CHUNK_ROWS = 64  # Block rows per vectorized _embed_blocks call
+
+    def __init__(self, workers=1, instrument=None):
         self.block_size = 8
         self.Q = 50  # Balanced for Crop/JPEG robustness
         self.SYNC_CODE = "11100011100011100011"  # 20 bits
+        self.workers = workers  # Strips embedded in parallel threads
+        self.instrument = instrument or _NO_INSTRUMENTATION  # See Instrumentation
 
-    def embed(self, image, watermark_text):
+    def embed(self, image, watermark_text, reference=False):
         """
         Embeds text using Block DCT with repetition (optimized for Crop/JPEG).
+        Set reference=True to run the original per-block loop (slow, kept for tests).
+        With workers > 1, the strips from partition_rows(h) are embedded in
+        parallel; the output does not depend on the worker count.
         """
-        img_yuv = cv2.cvtColor(image, cv2.COLOR_RGB2YCrCb)
-        h, w, _ = img_yuv.shape
-        y_channel = img_yuv[:, :, 0].astype(np.float32)
+        h, w = image.shape[:2]
+        plan, error = self.plan(watermark_text, h, w)
+        if error:
+            return None, error
 
-        # Prepare Packet: [SYNC][MSG][TERMINATOR]
-        binary_msg = ''.join(format(ord(char), '08b') for char in watermark_text)
-        binary_msg += '00000000'  # Terminator
-        
-        packet = self.SYNC_CODE + binary_msg
-        packet_len = len(packet)
+        if self.workers <= 1:
+            return self._embed_strip(image, plan, 0, reference), None
+
+        img_rgb = np.empty((h, w, 3), dtype=np.uint8)
+        embed_rows = lambda rows: self._embed_strip(
+            image[rows[0]:rows[1]], plan, rows[0] // self.block_size, reference, out=img_rgb[rows[0]:rows[1]])
+        with _pool(self.workers) as pool:
+            list(pool.map(embed_rows, self.partition_rows(h)))
+        return img_rgb, None
+
+    def partition_rows(self, h, strip_height=None):
+        """
+        Block-aligned (y0, y1) row ranges that embed work is split into: one per
+        worker by default, or strips of strip_height rows. The last range also
+        carries the rows below the last full block.
+        """
+        bs = self.block_size
+        if strip_height is None:
+            strip_height = -(-(h // bs) // max(1, self.workers)) * bs
+        strip_height = max(bs, strip_height // bs * bs)
+        ranges = []
+        for y0 in range(0, h, strip_height):
+            y1 = h if h - (y0 + strip_height) < bs else y0 + strip_height
+            ranges.append((y0, y1))
+            if y1 == h:
+                break
+        return ranges
+
+    def embed_streaming(self, source, watermark_text, out, strip_height=1024):
+        """
+        Embeds strip by strip so peak memory is O(strip) rather than O(image).
+        source is an (h, w, 3) array (np.memmap works) or a PIL Image; out is
+        any (h, w, 3) uint8 array-like that accepts row-slice assignment, e.g.
+        np.lib.format.open_memmap. Output is identical to embed().
+        Returns (out, error).
+        """
+        h, w, read_rows = row_source(source)
+        plan, error = self.plan(watermark_text, h, w)
+        if error:
+            return None, error
 
+        for y0, strip in self._iter_strips(read_rows, h, plan, strip_height):
+            out[y0:y0 + len(strip)] = strip
+        return out, None
+
+    def iter_embed_streaming(self, source, watermark_text, strip_height=1024):
+        """
+        Generator form of embed_streaming for custom writers: yields
+        (y0, watermarked_rgb_strip) top to bottom. Raises ValueError if the
+        text cannot be embedded.
+        """
+        h, w, read_rows = row_source(source)
+        plan, error = self.plan(watermark_text, h, w)
+        if error:
+            raise ValueError(error)
+        yield from self._iter_strips(read_rows, h, plan, strip_height)
+
+    def _iter_strips(self, read_rows, h, plan, strip_height):
+        """Yields (y0, strip) in order; with workers > 1, up to `workers` strips are in flight."""
+        embed_rows = lambda rows: (rows[0], self._embed_strip(read_rows(*rows), plan, rows[0] // self.block_size))
+        pool = _pool(self.workers)
+        try:
+            yield from _ordered_map(embed_rows, self.partition_rows(h, strip_height), pool, self.workers)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def plan(self, watermark_text, h, w):
+        """
+        (EmbeddingPlan, error) for embedding watermark_text in an h x w image.
+        Plans come from the embedding_plan cache, so images that share a text
+        and size share one plan.
+        """
         h_blocks = h // self.block_size
         w_blocks = w // self.block_size
-        total_blocks = h_blocks * w_blocks
-        
-        if total_blocks < packet_len:
+        try:
+            with self.instrument.stage('plan'):
+                plan = embedding_plan(watermark_text, h_blocks, w_blocks, self.Q, self.block_size, self.SYNC_CODE)
+        except UnicodeEncodeError:
+            return None, "Watermark text must use single-byte (Latin-1) characters."
+
+        if h_blocks * w_blocks < len(plan.packet):
             return None, "Image too small to hold this watermark text."
+        return plan, None
 
-        bit_idx = 0
+    def _embed_strip(self, image, plan, first_row, reference=False, out=None):
+        """
+        Embeds the blocks of a block-aligned run of rows. first_row is the
+        plan's block row of the strip's first block row.
+
+        Only luma is computed. Adding the same amount to R, G and B changes Y by
+        that amount and leaves Cb/Cr alone, so each pixel's luma change is
+        applied to the RGB pixels directly (clipped to 0..255) instead of going
+        through a YCrCb copy and back. The result is written into out (uint8,
+        image's height and width, 3 channels) if given, else a new array.
+        """
+        instrument = self.instrument
+        with instrument.stage('luma'):
+            y_orig = luma(image)
+            y_channel = y_orig.astype(np.float32)
+        h_blocks = y_channel.shape[0] // self.block_size
+
+        with instrument.stage('embed_blocks'):
+            if reference:
+                self._embed_blocks_reference(y_channel, plan.packet, h_blocks, plan.w_blocks,
+                                             first_row * plan.w_blocks)
+            else:
+                # A few block rows at a time keeps the float64 temporaries small
+                bs, chunk = self.block_size, self.EMBED_CHUNK_ROWS
+                for r0 in range(0, h_blocks, chunk):
+                    rows = min(chunk, h_blocks - r0)
+                    self._embed_blocks(y_channel[r0 * bs:(r0 + rows) * bs],
+                                       plan.bits[first_row + r0:first_row + r0 + rows], plan.basis)
+        instrument.count('blocks_embedded', h_blocks * plan.w_blocks)
+
+        with instrument.stage('apply_rgb'):
+            # New luma is truncated to uint8, as the engines' idct output always was
+            np.clip(y_channel, 0, 255, out=y_channel)
+            delta = y_channel.astype(np.int16)
+            delta -= y_orig
+            del y_channel
+
+            if out is None:
+                out = np.empty(image.shape[:2] + (3,), dtype=np.uint8)
+            pixel = np.empty_like(delta)
+            for c in range(3):
+                np.add(image[:, :, c], delta, out=pixel)
+                np.clip(pixel, 0, 255, out=pixel)
+                out[:, :, c] = pixel
+        return out
+
+    def _embed_blocks(self, y_channel, bits, basis):
+        """
+        Vectorized engine: all [3,3] coefficients and parity corrections are
+        computed at once, and each block gets `delta * basis` added instead of an idct.
+        bits is the (h_blocks, w_blocks) slice of the plan's bit map for these rows.
+        Bit-identical to _embed_blocks_reference.
+        """
+        bs = self.block_size
+        step = self.Q
+        h_blocks, w_blocks = bits.shape
+
+        region = y_channel[:h_blocks * bs, :w_blocks * bs]
+        blocks = block_view(region, bs)
+        coeffs = np.einsum('ijkl,kl->ij', blocks, basis)
+
+        quantized = np.rint(coeffs / step)
+        quantized += np.mod(quantized, 2) != bits
+        delta = quantized * step - coeffs
+        new_blocks = blocks + delta[:, :, None, None] * basis
+
+        # The reference path truncates float32 idct output to uint8, so a pixel
+        # sitting within float error of an integer (or a coefficient at a .5
+        # rounding boundary) may land either way. Redo those blocks exactly.
+        frac = new_blocks - np.floor(new_blocks)
+        ambiguous = ((frac < 1e-4) | (frac > 1 - 1e-4)).any(axis=(2, 3))
+        ambiguous |= np.abs(np.mod(coeffs, step) - step / 2) < 1e-3
+
+        new_blocks = new_blocks.astype(np.float32)
+        memo = {}
+        for r, c in np.argwhere(ambiguous):
+            block = np.ascontiguousarray(blocks[r, c])
+            key = (block.tobytes(), bits[r, c])
+            if key not in memo:
+                memo[key] = self._embed_block(block, bits[r, c])
+            new_blocks[r, c] = memo[key]
+
+        blocks[...] = new_blocks
+
+    def _embed_blocks_reference(self, y_channel, packet, h_blocks, w_blocks, first_block=0):
+        """Original per-block loop: dct, round one coefficient, idct."""
+        bit_idx = first_block
+        packet_len = len(packet)
         
         for r in range(h_blocks):
             for c in range(w_blocks):
@@ -41,44 +394,772 @@ class WatermarkEmbedder:
                 c_start = c * self.block_size
                 block = y_channel[r_start:r_start+self.block_size, c_start:c_start+self.block_size]
                 
-                dct_block = cv2.dct(block)
-                coeff = dct_block[3, 3]
-                
-                step = self.Q
-                quantized = round(coeff / step)
-                
-                if bit == 0:
-                    if quantized % 2 != 0:
-                        quantized += 1 
-                else: 
-                    if quantized % 2 == 0:
-                        quantized += 1
-                
-                new_coeff = quantized * step
-                dct_block[3, 3] = new_coeff
-                
-                idct_block = cv2.idct(dct_block)
-                y_channel[r_start:r_start+self.block_size, c_start:c_start+self.block_size] = idct_block
+                y_channel[r_start:r_start+self.block_size, c_start:c_start+self.block_size] = self._embed_block(block, bit)
                 
                 bit_idx += 1
 
-        img_yuv[:, :, 0] = np.clip(y_channel, 0, 255)
-        img_rgb = cv2.cvtColor(img_yuv, cv2.COLOR_YCrCb2RGB)
+    def _embed_block(self, block, bit):
+        dct_block = cv2.dct(block)
+        coeff = dct_block[3, 3]
         
-        return img_rgb, None
+        step = self.Q
+        quantized = round(coeff / step)
+        
+        if bit == 0:
+            if quantized % 2 != 0:
+                quantized += 1 
+        else: 
+            if quantized % 2 == 0:
+                quantized += 1
+        
+        new_coeff = quantized * step
+        dct_block[3, 3] = new_coeff
+        
+        return cv2.idct(dct_block)
 
-class WatermarkDecoder:
+class DecodeCancelled(Exception):
+    """Raised by a decode whose CancellationToken was cancelled."""
+
+class CancellationToken:
+    """Cooperative cancellation for decodes, checked between units of work. Thread-safe."""
     def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise DecodeCancelled("Decode cancelled.")
+
+@dataclass
+class DecodeProgress:
+    """Passed to a decode's progress callback after each unit of work."""
+    done: int  # Units finished: (band, offset) scans, JPEG block rows or scale probes
+    total: int  # Units expected so far; grows if a decode widens its search
+    text: Optional[str] = None  # Current leading candidate
+    votes: int = 0
+    total_votes: int = 0
+
+def _report(progress, done, total, tally=None, votes=0):
+    """Calls progress with the tally's current leader, if there is a callback."""
+    if progress is None:
+        return
+    text, leader_votes, _ = tally.leader() if tally is not None else (None, votes, 0)
+    progress(DecodeProgress(done, max(done, total), text, leader_votes, tally.total if tally is not None else votes))
+
+class _StagedProgress:
+    """
+    The progress callback of one decode call, which may run in stages (a band
+    or coefficient search, then a full-grid fallback). A later stage's units
+    follow the earlier ones, done and total never go back, and the last
+    update has done == total, also after an early exit.
+    """
+    def __init__(self, progress):
+        self.progress = progress
+        self.base = self.done = self.total = 0
+        self.last = None
+
+    @classmethod
+    def wrap(cls, progress):
+        """None stays None; a decode nested in another keeps the outer one's stages."""
+        return progress if progress is None or isinstance(progress, cls) else cls(progress)
+
+    def __call__(self, update):
+        self.done = max(self.done, self.base + update.done)
+        self.total = max(self.total, self.base + update.total, self.done)
+        self.last = replace(update, done=self.done, total=self.total)
+        self.progress(self.last)
+
+    def next_stage(self):
+        self.base = self.done
+
+    def finish(self):
+        if self.last is not None and self.done < self.total:
+            self.done = self.total
+            self.last = replace(self.last, done=self.done)
+            self.progress(self.last)
+
+def _next_stage(progress):
+    if progress is not None:
+        progress.next_stage()
+
+def _finished(progress, result):
+    """result, after reporting the decode's progress as complete."""
+    if progress is not None:
+        progress.finish()
+    return result
+
+@dataclass
+class DecodeResult:
+    """Outcome of WatermarkDecoder.decode_detailed."""
+    text: Optional[str] = None
+    error: Optional[str] = None
+    confidence: float = 0.0  # Share of all votes held by the winning text
+    votes: int = 0
+    runner_up: int = 0  # Votes of the second text (whole-message votes only)
+    total_votes: int = 0
+    offsets_tried: int = 0
+    scanned_fraction: float = 0.0  # Share of the full 64-offset grid search evaluated
+    early_exit: bool = False
+    domain: str = 'pixel'  # 'jpeg' when read from the JPEG's own DCT coefficients
+    scale: float = 1.0  # Resize factor undone before decoding (decode_scaled)
+    workers: int = 1
+    # Work actually applied, per band: (y0, y1, offsets scanned), where y0:y1
+    # are the rows read including the halo. Offsets are scanned in batches of
+    # `workers`; bands are prefetched `workers` ahead.
+    partitions: list = field(default_factory=list)
+    # Row ranges (y0, y1) read by decode_progressive, in scan order
+    regions: list = field(default_factory=list)
+
+    def is_decisive(self, vote_margin, min_confidence):
+        """The same test as early exit: a lead of vote_margin votes and min_confidence."""
+        return (self.text is not None and self.votes - self.runner_up >= vote_margin
+                and self.confidence >= min_confidence)
+
+class WatermarkDecoder:
+    def __init__(self, workers=1, instrument=None):
         self.block_size = 8
         self.Q = 50
         self.SYNC_CODE = "11100011100011100011"
+        self.max_payload_bits = 400  # Search window after SYNC for the terminator
+        self.min_text_length = 3
+        # Soft early exit also needs every bit used to agree at least this much
+        # (|soft sum| / repetitions), so one weak bit cannot flip a character
+        self.min_bit_agreement = 0.15
+        self.band_blocks = 32  # Block rows per scanning band
+        # Bands and grid offsets scanned in parallel threads. Results are applied
+        # in sequential order, so they do not depend on the worker count.
+        self.workers = workers
+        # Stages: luma, coefficients, parity, sync_search, parse, vote,
+        # entropy_decode (JPEG path), scale_search (which includes its probes'
+        # own stages). Counters: blocks_scanned, offsets_tried, sync_hits,
+        # candidates, votes. See Instrumentation.
+        self.instrument = instrument or _NO_INSTRUMENTATION
 
-    def decode(self, image):
-        img_yuv = cv2.cvtColor(image, cv2.COLOR_RGB2YCrCb)
-        y_channel = img_yuv[:, :, 0].astype(np.float32)
-        h, w = y_channel.shape
+    def decode(self, image, reference=False, progress=None, cancel=None):
+        """
+        Set reference=True to run the original 64-pass block loop (slow, kept for tests).
+        progress(DecodeProgress) is called after each unit of work. done and total
+        never decrease, also across a fallback stage, and the last call has
+        done == total. A cancelled CancellationToken makes the decode raise
+        DecodeCancelled.
+        """
+        if reference:
+            y_channel = self._luma(image)
+            tally = _VoteTally(self.instrument)
+            for offset_key, bit_stream in self._extract_bitstreams_reference(y_channel):
+                scanner = _SyncScanner(self)
+                for payloads, positions in (scanner.feed(bit_stream), scanner.finish()):
+                    tally.add(payloads, offset_key, positions)
+            result = self._result(tally)
+        else:
+            result = self.decode_detailed(image, progress=progress, cancel=cancel)
+        return result.text, result.error
+
+    def decode_detailed(self, image, early_exit=False, vote_margin=3, min_confidence=None, soft=False,
+                        progress=None, cancel=None):
+        """
+        Grid search over all 8x8 offsets, scanned top to bottom in bands.
+        With early_exit=True, offsets whose coefficients sit closest to the
+        quantization lattice go first, and scanning stops once the leading text
+        is vote_margin votes ahead and holds min_confidence of all votes.
+        Otherwise every offset and block is scanned.
+
+        With soft=True, whole-message voting is replaced by per-bit voting: the
+        soft value cos(pi * coeff / Q) of every packet repetition is summed at
+        each bit position (aligned on SYNC hits) and the sum is decoded once.
+        votes is then the number of repetitions combined and confidence the mean
+        per-bit agreement; early exit needs vote_margin repetitions at
+        min_confidence agreement. min_confidence defaults to 0.5 for
+        whole-message votes and 0.75 for per-bit agreement.
+
+        progress and cancel are as for decode; every decode_* method takes them.
+        """
+        h, w = image.shape[:2]
+        read_luma = lambda y0, y1: self._luma(image[y0:y1])
+        progress = _StagedProgress.wrap(progress)
+        return _finished(progress, self._decode_rows(read_luma, h, w, early_exit, vote_margin, min_confidence,
+                                                     soft, progress=progress, cancel=cancel))
+
+    def decode_streaming(self, source, strip_height=1024, **options):
+        """
+        decode_detailed for sources too large to hold in memory: an (h, w, 3)
+        array (np.memmap works) or a PIL Image is read strip_height rows at a
+        time (plus a 7-row halo). Same options and result as decode_detailed.
+        """
+        h, w, read_rows = row_source(source)
+        read_luma = lambda y0, y1: self._luma(read_rows(y0, y1))
+        progress = options['progress'] = _StagedProgress.wrap(options.get('progress'))
+        band_blocks = max(1, strip_height // self.block_size)
+        return _finished(progress, self._decode_rows(read_luma, h, w, band_blocks=band_blocks, **options))
+
+    def decode_progressive(self, source, band_blocks=4, initial_bands=3, max_fraction=0.25,
+                           vote_margin=3, min_confidence=0.5, progress=None, cancel=None):
+        """
+        Region-of-interest decode. One packet spans at most a few hundred blocks,
+        and a full-width band of a few block rows already repeats it several
+        times. So instead of the whole image, thin bands are scanned: the centre
+        band first, then bands spread evenly over the height. Their number
+        doubles each round, but only while no text is vote_margin votes ahead
+        with min_confidence of all votes. Only the rows of scanned bands are
+        read and transformed.
+
+        If max_fraction of the rows have been scanned and nothing is decisive,
+        the whole image is searched with decode_streaming(early_exit=True).
+        source is anything decode_streaming takes. result.regions lists the
+        row ranges read, including the halo.
+        """
+        bs = self.block_size
+        h, w, read_rows = row_source(source)
+        w_blocks = w // bs
+        progress = _StagedProgress.wrap(progress)
+        if not w_blocks or h < bs:
+            return self.decode_streaming(source, early_exit=True, vote_margin=vote_margin,
+                                         min_confidence=min_confidence, progress=progress, cancel=cancel)
+
+        # Bands must hold a couple of search windows even when rows are short
+        window = len(self.SYNC_CODE) + 8 * ((self.max_payload_bits - 1) // 8) + 1
+        rows = max(band_blocks, -(-2 * window // w_blocks))
+        slots = list(range(0, h - bs + 1, rows * bs))
+        order = []
+        for i in range(1, 2 * len(slots) + 2):
+            # Centre first, then a van der Corput sequence spreads bands evenly
+            frac, base, k = 0.0, 0.5, i
+            while k:
+                frac += base * (k & 1)
+                k >>= 1
+                base /= 2
+            slot = slots[min(len(slots) - 1, int(frac * len(slots)))]
+            if slot not in order:
+                order.append(slot)
+        order += [y0 for y0 in slots if y0 not in order]
+
+        offsets = [(oy, ox) for oy in range(bs) for ox in range(bs)
+                   if (h - oy) // bs > 0 and (w - ox) // bs > 0]
+        total_blocks = sum(((h - oy) // bs) * ((w - ox) // bs) for oy, ox in offsets)
+        basis = dct_basis(bs, 3, 3)
+        tally = _VoteTally(self.instrument)
+        tried = set()
+        regions = []
+        scanned = 0
+        budget = max(initial_bands, int(max_fraction * len(slots)))
+
+        def band_maps(y0):
+            if cancel is not None:
+                cancel.check()
+            y1 = min(h, y0 + rows * bs + bs - 1)
+            response = self._coefficients(self._luma(read_rows(y0, y1)), basis)
+            return y0, y1, response, self._parity(response)
+
+        pool = _pool(self.workers)
+        try:
+            done, batch = 0, initial_bands
+            while done < min(budget, len(order)):
+                todo = order[done:min(done + batch, budget)]
+                for y0, y1, response, parity in _ordered_map(band_maps, todo, pool, self.workers):
+                    if not regions:
+                        offsets = self._rank_offsets(response, offsets, w)
+                    regions.append((y0, y1))
+                    for oy, ox in offsets:
+                        tried.add((oy, ox))
+                        bits = self._band_coefficients(parity, oy, ox, w).ravel()
+                        scanner = _SyncScanner(self)
+                        for payloads, positions in (scanner.feed(bits), scanner.finish()):
+                            tally.add(payloads, oy * bs + ox, positions)
+                        scanned += bits.size
+                        self.instrument.count('blocks_scanned', bits.size)
+                        if cancel is not None:
+                            cancel.check()
+                        _report(progress, len(tried) + len(offsets) * (len(regions) - 1),
+                                len(offsets) * min(budget, len(order)), tally)
+                        if tally.is_decisive(vote_margin, min_confidence):
+                            result = self._result(tally, len(tried), scanned / total_blocks, early_exit=True)
+                            result.workers, result.regions = self.workers, regions
+                            return _finished(progress, result)
+                done += len(todo)
+                batch *= 2
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        _next_stage(progress)
+        result = self.decode_streaming(source, early_exit=True, vote_margin=vote_margin,
+                                       min_confidence=min_confidence, progress=progress, cancel=cancel)
+        result.regions = regions + [(0, h)]
+        return result
+
+    def decode_jpeg(self, data, pixels=None, early_exit=True, vote_margin=3, min_confidence=None, soft=False,
+                    probe_blocks=1024, progress=None, cancel=None):
+        """
+        Fast path for JPEG file bytes. When the image was not cropped, the JPEG's
+        own 8x8 luma blocks are the embedding grid, so the [3,3] coefficients are
+        read (dequantized) straight from the bitstream for offset (0, 0) only,
+        and reading stops once one text is decisive (as for early_exit).
+
+        Falls back to the pixel-domain grid search (decode_streaming on pixels,
+        or on the decoded data when not given; early_exit applies here) if the
+        file is not a baseline JPEG, no SYNC shows up in the first probe_blocks
+        blocks (a few packet lengths), or the whole image gives no text. result.domain tells
+        which path answered.
+        """
+        if min_confidence is None:
+            min_confidence = 0.75 if soft else 0.5
+        progress = _StagedProgress.wrap(progress)
+        try:
+            result = self._decode_jpeg_coefficients(data, vote_margin, min_confidence, soft, probe_blocks,
+                                                     progress, cancel)
+        except JPEGUnsupported:
+            result = None
+        if result is not None:
+            return _finished(progress, result)
+
+        if pixels is None:
+            bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+            if bgr is None:
+                return _finished(progress, DecodeResult(error="Could not read image data."))
+            pixels = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        _next_stage(progress)
+        return self.decode_streaming(pixels, early_exit=early_exit, vote_margin=vote_margin,
+                                     min_confidence=min_confidence, soft=soft, progress=progress, cancel=cancel)
+
+    def _decode_jpeg_coefficients(self, data, vote_margin, min_confidence, soft, probe_blocks,
+                                  progress=None, cancel=None):
+        """DecodeResult from the compressed-domain pass, or None to fall back."""
+        bs = self.block_size
+        header = read_header(data)
+        h, w = header.height, header.width
+        h_blocks, w_blocks = h // bs, w // bs
+        total_blocks = sum(((h - oy) // bs) * ((w - ox) // bs) for oy in range(bs) for ox in range(bs))
+        if not h_blocks or not w_blocks:
+            return None
+
+        scanner = _SyncScanner(self, soft, w_blocks)
+        tally = _VoteTally(self.instrument)
+        scanned = 0
+        coefficient_rows = luma_coefficient_rows(data, 3, 3, header)
+        for row in range(h_blocks):
+            with self.instrument.stage('entropy_decode'):
+                coeffs = next(coefficient_rows, None)
+            if coeffs is None:
+                break
+            coeffs = coeffs[:w_blocks]
+            bits = self._parity(coeffs)
+            if soft:
+                scanner.feed(bits, np.cos(coeffs * (np.pi / self.Q)).astype(np.float32))
+            else:
+                payloads, positions = scanner.feed(bits)
+                tally.add(payloads, 0, positions)
+            scanned += w_blocks
+            self.instrument.count('blocks_scanned', w_blocks)
+            if cancel is not None:
+                cancel.check()
+            _report(progress, row + 1, h_blocks, None if soft else tally, scanner.hits)
+
+            result = None
+            if soft:
+                if scanner.hits >= vote_margin:
+                    result = self._soft_result([scanner], 1, scanned / total_blocks, early_exit=True,
+                                               min_count=vote_margin)
+                    if result.confidence < min_confidence:
+                        result = None
+            elif tally.is_decisive(vote_margin, min_confidence):
+                result = self._result(tally, 1, scanned / total_blocks, early_exit=True)
+            if result is not None:
+                result.domain = 'jpeg'
+                return result
+            if scanned >= probe_blocks and not scanner.hits:
+                return None
+
+        payloads, positions = scanner.finish()
+        tally.add(payloads, 0, positions)
+        result = (self._soft_result([scanner], 1, scanned / total_blocks) if soft
+                  else self._result(tally, 1, scanned / total_blocks))
+        if result.text is None:
+            return None
+        result.domain = 'jpeg'
+        return result
+
+    def decode_scaled(self, image, min_scale=0.5, max_scale=2.0, max_candidates=12, probe_rows=128, **options):
+        """
+        Decode an image that may have been resized after embedding.
+
+        The watermark changes every 8x8 block separately, so luma gradients line
+        up every 8 * scale pixels. The spectrum of the mean |gradient| profile
+        across the width therefore peaks at that period (and its harmonics).
+        Its strongest peaks give up to max_candidates resize factors, always
+        starting with 1.0. Each factor implies an original width, which is
+        checked by counting SYNC hits on a central strip of probe_rows rows
+        rescaled to that width. The best width is refined by +/-2 pixels, and
+        only then is the whole image rescaled and decoded with
+        decode_detailed(**options). result.scale is the factor that was undone.
+        Each width probe counts as one unit for options['progress'].
+
+        Interpolation blurs the mark, so a rescaled decode is only accepted when
+        it is decisive (as for early exit, with options' vote_margin and
+        min_confidence); a plurality of a few votes is usually a misread. If no
+        probe finds SYNC at all, no decode is attempted. Enlargements and
+        reductions to about 0.75 are found; 0.8-0.9 reductions usually are not.
+        """
+        h, w = image.shape[:2]
+        probed = {}
+        progress = options['progress'] = _StagedProgress.wrap(options.get('progress'))
+        cancel = options.get('cancel')
+
+        def probe(width):
+            if width not in probed:
+                if cancel is not None:
+                    cancel.check()
+                probed[width] = self._probe_width(image, width, probe_rows) if width >= self.block_size else 0
+                _report(progress, len(probed), max_candidates + 4, votes=max(probed.values()))
+            return probed[width]
+
+        with self.instrument.stage('scale_search'):
+            for scale in self._scale_candidates(image, min_scale, max_scale)[:max_candidates]:
+                # A random stream almost never holds SYNC; stop at the first clear match
+                if probe(round(w / scale)) >= 8:
+                    break
+            best_width = max(probed, key=probed.get)
+            if probed[best_width]:
+                for width in (best_width - 2, best_width - 1, best_width + 1, best_width + 2):
+                    probe(width)
+                best_width = max(probed, key=probed.get)
+
+        if not probed[best_width]:
+            return _finished(progress, DecodeResult(error="No watermark detected."))
+        _next_stage(progress)
+        if best_width == w:
+            return self.decode_detailed(image, **options)
+        height = max(1, round(h * best_width / w))
+        result = self.decode_detailed(cv2.resize(image, (best_width, height), interpolation=cv2.INTER_CUBIC),
+                                      **options)
+        result.scale = w / best_width
+        min_confidence = options.get('min_confidence')
+        if min_confidence is None:
+            min_confidence = 0.75 if options.get('soft') else 0.5
+        if not result.is_decisive(options.get('vote_margin', 3), min_confidence):
+            result.text, result.error = None, "No watermark detected."
+        return result
+
+    def _scale_candidates(self, image, min_scale, max_scale, peaks=4, lines=256):
+        """Likely horizontal resize factors, strongest spectral peak first."""
+        bs = self.block_size
+        h, w = image.shape[:2]
+        candidates = [1.0]
+        profile = np.abs(np.diff(self._luma(image[::max(1, h // lines)]), axis=1)).mean(axis=0)
+        if len(profile) < 4 * bs:
+            return candidates
+        profile -= profile.mean()
+
+        n_fft = 1 << int(np.ceil(np.log2(8 * len(profile))))
+        magnitude = np.abs(np.fft.rfft(profile, n_fft))
+        freqs = np.fft.rfftfreq(n_fft)
+        usable = (freqs >= 1 / (bs * max_scale)) & (freqs <= 0.4)
+        is_peak = np.zeros_like(usable)
+        is_peak[1:-1] = (magnitude[1:-1] >= magnitude[:-2]) & (magnitude[1:-1] > magnitude[2:])
+        found = np.flatnonzero(is_peak & usable)
+        found = found[np.argsort(-magnitude[found], kind='stable')[:peaks]]
+
+        # Refine each peak with a direct DFT on a grid 40x finer than the FFT bins
+        positions = np.arange(len(profile))
+        for index in found:
+            fine = freqs[index] + np.linspace(-1, 1, 81) / n_fft
+            response = np.abs(np.exp(-2j * np.pi * np.outer(fine, positions)) @ profile)
+            f = fine[np.argmax(response)]
+            for harmonic in (1, 2, 3):
+                scale = harmonic / (bs * f)
+                if min_scale <= scale <= max_scale and all(abs(scale / c - 1) > 0.002 for c in candidates):
+                    candidates.append(scale)
+        return candidates
+
+    def _probe_width(self, image, width, probe_rows):
+        """Most SYNC hits over all offsets in a central strip, rescaled as if the original were `width` wide."""
+        bs = self.block_size
+        h, w = image.shape[:2]
+        height = max(1, round(h * width / w))
+        rows = min(height, probe_rows)
+        top = (height - rows) // 2
+        y0 = int(top * h / height)
+        y1 = min(h, int(np.ceil((top + rows) * h / height)) + 1)
+        strip = cv2.resize(image[y0:y1], (width, max(bs, round((y1 - y0) * height / h))),
+                           interpolation=cv2.INTER_CUBIC)
+        parity = self._parity(self._coefficients(self._luma(strip), dct_basis(bs, 3, 3)))
+        best = 0
+        for oy in range(bs):
+            for ox in range(bs):
+                bits = self._band_coefficients(parity, oy, ox, width)
+                best = max(best, len(self._sync_hits(bits.ravel())))
+        return best
+
+    def _luma(self, image):
+        with self.instrument.stage('luma'):
+            return luma(image).astype(np.float32)
+
+    def _coefficients(self, channel, basis):
+        with self.instrument.stage('coefficients'):
+            return coefficient_map(channel, basis)
+
+    def _decode_rows(self, read_luma, h, w, early_exit=False, vote_margin=3, min_confidence=None, soft=False,
+                     band_blocks=None, progress=None, cancel=None):
+        """
+        Core grid search. read_luma(y0, y1) returns the float32 Y rows y0:y1, so
+        only one band (plus a bs - 1 row halo) is converted and held at a time.
+        """
+        if min_confidence is None:
+            min_confidence = 0.75 if soft else 0.5
+        bs = self.block_size
+        basis = dct_basis(bs, 3, 3)
+        band = (band_blocks or self.band_blocks) * bs
+
+        offsets = [(oy, ox) for oy in range(bs) for ox in range(bs)
+                   if (h - oy) // bs > 0 and (w - ox) // bs > 0]
+        total_blocks = sum(((h - oy) // bs) * ((w - ox) // bs) for oy, ox in offsets)
+        scanners = {(oy, ox): _SyncScanner(self, soft, (w - ox) // bs) for oy, ox in offsets}
+        tally = _VoteTally(self.instrument)
+        tried = set()
+        scanned = 0
+        done = 0
+        partitions = []
+
+        def band_maps(rows):
+            if cancel is not None:
+                cancel.check()
+            response = self._coefficients(read_luma(*rows), basis)
+            soft_values = np.cos(response * (np.pi / self.Q)).astype(np.float32) if soft else None
+            return response, self._parity(response), soft_values
+
+        # Halo of bs - 1 rows so blocks starting near the band's end are complete
+        bands = [(y0, min(h, y0 + band + bs - 1)) for y0 in range(0, h, band)]
+        pool = _pool(self.workers)
+        try:
+            for (y0, y1), (response, parity, soft_values) in zip(
+                    bands, _ordered_map(band_maps, bands, pool, self.workers)):
+                if y0 == 0 and early_exit:
+                    offsets = self._rank_offsets(response, offsets, w)
+
+                def scan(offset):
+                    bits = self._band_coefficients(parity, *offset, w).ravel()
+                    if soft:
+                        scanners[offset].feed(bits, self._band_coefficients(soft_values, *offset, w).ravel())
+                        return bits.size, None
+                    return bits.size, scanners[offset].feed(bits)
+
+                units = [o for o in offsets if self._band_coefficients(parity, *o, w).size]
+                partitions.append((y0, y1, len(units)))
+                for start in range(0, len(units), max(1, self.workers)):
+                    batch = units[start:start + max(1, self.workers)]
+                    for (oy, ox), (n_bits, found) in zip(batch, _ordered_map(scan, batch, pool, len(batch))):
+                        scanner = scanners[(oy, ox)]
+                        if found is not None:
+                            payloads, positions = found
+                            tally.add(payloads, oy * bs + ox, positions)
+                        tried.add((oy, ox))
+                        scanned += n_bits
+                        self.instrument.count('blocks_scanned', n_bits)
+                        done += 1
+                        if cancel is not None:
+                            cancel.check()
+                        _report(progress, done, len(bands) * len(offsets), None if soft else tally,
+                                scanner.hits)
+
+                        if not early_exit:
+                            continue
+                        result = None
+                        if soft:
+                            if scanner.hits >= vote_margin:
+                                result = self._soft_result([scanner], len(tried), scanned / total_blocks,
+                                                           early_exit=True, min_count=vote_margin)
+                                if result.confidence < min_confidence:
+                                    result = None
+                        elif tally.is_decisive(vote_margin, min_confidence):
+                            result = self._result(tally, len(tried), scanned / total_blocks, early_exit=True)
+                        if result is not None:
+                            result.workers, result.partitions = self.workers, partitions
+                            return result
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        for (oy, ox), scanner in scanners.items():
+            payloads, positions = scanner.finish()
+            tally.add(payloads, oy * bs + ox, positions)
+
+        scanned_fraction = scanned / total_blocks if total_blocks else 0.0
+        if soft:
+            result = self._soft_result(list(scanners.values()), len(tried), scanned_fraction)
+        else:
+            result = self._result(tally, len(tried), scanned_fraction)
+        result.workers, result.partitions = self.workers, partitions
+        return result
+
+    def _parity(self, coeffs):
+        """Parity (0/1, uint8) of each coefficient's nearest multiple of Q."""
+        with self.instrument.stage('parity'):
+            quantized = coeffs / self.Q
+            np.rint(quantized, out=quantized)
+            # |coeff| <= 255 * block_size, so the lattice index fits easily in int16
+            return (quantized.astype(np.int16) & 1).astype(np.uint8)
+
+    def _band_coefficients(self, response, offset_y, offset_x, w):
+        """
+        [3,3] coefficients of one grid offset's blocks whose top row lies in the
+        band. response covers the band plus a bs - 1 row halo (or ends at the
+        image bottom), so blocks must start bs - 1 rows before its end.
+        """
+        bs = self.block_size
+        row_end = response.shape[0] - bs + 1
+        if row_end <= offset_y:
+            return response[:0, :0]
+        n_rows = (row_end - offset_y + bs - 1) // bs
+        w_blocks = (w - offset_x) // bs
+        return response[offset_y:offset_y + n_rows * bs:bs, offset_x::bs][:, :w_blocks]
+
+    def _rank_offsets(self, response, offsets, w):
+        """
+        Order offsets best first by the share of coefficients within Q/4 of an odd
+        multiple of Q. On the embedding grid roughly every 1-bit lands there;
+        elsewhere smooth areas sit near 0 and texture spreads evenly.
+        """
+        scores = []
+        for oy, ox in offsets:
+            coeffs = self._band_coefficients(response, oy, ox, w) / self.Q
+            half = (coeffs - 1) / 2
+            scores.append((np.abs(half - np.rint(half)) < 0.125).mean() if coeffs.size else 0.0)
+        return [offsets[i] for i in np.argsort(-np.array(scores), kind='stable')]
+
+    def _result(self, tally, offsets_tried=0, scanned_fraction=1.0, early_exit=False):
+        self.instrument.count('offsets_tried', offsets_tried)
+        text, votes, runner_up = tally.leader()
+        if text is None:
+            return DecodeResult(error="No watermark detected.", offsets_tried=offsets_tried,
+                                scanned_fraction=scanned_fraction, early_exit=early_exit)
+        return DecodeResult(
+            text=text,
+            confidence=votes / tally.total,
+            votes=votes,
+            runner_up=runner_up,
+            total_votes=tally.total,
+            offsets_tried=offsets_tried,
+            scanned_fraction=scanned_fraction,
+            early_exit=early_exit,
+        )
+
+    def _soft_result(self, scanners, offsets_tried=0, scanned_fraction=1.0, early_exit=False, min_count=1):
+        """
+        Decode the accumulated soft evidence of the offset with the most SYNC hits.
+        Every bit used must be backed by at least min_count repetitions and, for
+        an early exit, agree at least min_bit_agreement.
+        """
+        self.instrument.count('offsets_tried', offsets_tried)
+        best = max(scanners, key=lambda s: s.hits, default=None)
+        text, confidence = None, 0.0
+        if best is not None and best.hits:
+            min_agreement = self.min_bit_agreement if early_exit else 0.0
+            text, confidence = self._decode_soft(best.soft_sum, best.soft_count, min_count, min_agreement)
+            if text is None:
+                # Rows narrower than the packet: only valid if the width is uncropped,
+                # in which case repetitions are spaced by whole packet lengths. That
+                # spacing needs at least two hits to check, so one hit is not enough.
+                if len(best.hit_positions) >= 2:
+                    text, confidence = self._decode_soft(best.wrap_sum, best.wrap_count, min_count, min_agreement)
+                packet_len = len(self.SYNC_CODE) + 8 * (len(text) + 1) if text else 0
+                if text and np.mean(np.diff(best.hit_positions) % packet_len == 0) < 0.5:
+                    text, confidence = None, 0.0
+        if text is None:
+            return DecodeResult(error="No watermark detected.", offsets_tried=offsets_tried,
+                                scanned_fraction=scanned_fraction, early_exit=early_exit)
+        return DecodeResult(
+            text=text,
+            confidence=confidence,
+            votes=best.hits,
+            total_votes=sum(s.hits for s in scanners),
+            offsets_tried=offsets_tried,
+            scanned_fraction=scanned_fraction,
+            early_exit=early_exit,
+        )
+
+    def _decode_soft(self, soft_sum, soft_count, min_count=1, min_agreement=0.0):
+        """
+        Text and mean per-bit agreement (0..1) from soft evidence summed over
+        packet repetitions, or (None, 0.0) if it does not parse from bits seen
+        at least min_count times, or any bit used agrees less than min_agreement.
+        """
+        sync_len = len(self.SYNC_CODE)
+        max_bytes = (self.max_payload_bits - 1) // 8
+        evidence = soft_sum[sync_len:sync_len + 8 * max_bytes]
+        count = soft_count[sync_len:sync_len + 8 * max_bytes]
+
+        payload = np.packbits(evidence < 0)  # cos < 0 means an odd lattice point, bit 1
+        covered = (count.reshape(max_bytes, 8) >= max(min_count, 1)).all(axis=1)
+        is_terminator = (payload == 0) & covered
+        if not is_terminator.any():
+            return None, 0.0
+        
+        text_len = int(np.argmax(is_terminator))
+        text_bytes = payload[:text_len]
+        printable = (text_bytes >= 32) & (text_bytes <= 126)
+        if text_len < self.min_text_length or not (printable & covered[:text_len]).all():
+            return None, 0.0
         
-        # Grid Search (for crop robustness)
+        used = slice(0, 8 * (text_len + 1))
+        agreement = np.abs(evidence[used]) / count[used]
+        if agreement.min() < min_agreement:
+            return None, 0.0
+        confidence = float(np.mean(agreement))
+        return text_bytes.tobytes().decode('ascii'), confidence
+
+    def _sync_hits(self, bit_stream):
+        """
+        Start positions of SYNC in a 0/1 bit array, found by correlating the +/-1
+        stream with the +/-1 sync pattern. May include overlapping hits.
+        """
+        sync = bits_from_string(self.SYNC_CODE).astype(np.int8) * 2 - 1
+        if len(bit_stream) < len(sync):
+            return np.zeros(0, dtype=np.int64)
+        with self.instrument.stage('sync_search'):
+            score = np.correlate(bit_stream.astype(np.int8) * 2 - 1, sync, mode='valid')
+            return np.flatnonzero(score == len(sync))
+
+    def _payloads_at(self, bit_stream, hits):
+        """
+        Decode the message after every SYNC hit at once.
+        Returns an (n, max_bytes) uint8 array holding, for each hit, the printable
+        ASCII run before the terminator byte (zero-padded on the right), and a
+        mask of which hits gave a valid candidate.
+        """
+        max_bytes = (self.max_payload_bits - 1) // 8
+        if len(hits) == 0:
+            return np.zeros((0, max_bytes), dtype=np.uint8), np.zeros(0, dtype=bool)
+        with self.instrument.stage('parse'):
+            payload, valid = self._parse_payloads(bit_stream, hits, max_bytes)
+        self.instrument.count('candidates', len(payload))
+        return payload, valid
+
+    def _parse_payloads(self, bit_stream, hits, max_bytes):
+        msg_start = hits + len(self.SYNC_CODE)
+        padded = np.concatenate([bit_stream, np.zeros(max_bytes * 8, dtype=np.uint8)])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, max_bytes * 8)[msg_start]
+        payload = np.packbits(windows, axis=1)
+        
+        # A byte only counts if the stream extends past it, as in the original search.
+        available = np.minimum(max_bytes, (len(bit_stream) - msg_start - 1) // 8)
+        in_range = np.arange(max_bytes) < available[:, None]
+        
+        is_terminator = (payload == 0) & in_range
+        printable = (payload >= 32) & (payload <= 126)
+        text_len = np.where(printable.all(axis=1), max_bytes, np.argmin(printable, axis=1))
+        valid = is_terminator.any(axis=1) & (text_len >= self.min_text_length)
+        
+        payload = payload[valid]
+        payload[np.arange(max_bytes) >= text_len[valid][:, None]] = 0
+        return payload, valid
+
+    def _extract_bitstreams_reference(self, y_channel):
+        h, w = y_channel.shape
         all_extractions = []
         
         for offset_y in range(self.block_size):
@@ -104,51 +1185,130 @@ class WatermarkDecoder:
                         quantized = round(coeff / step)
                         
                         if quantized % 2 == 0:
-                            extracted_bits.append('0')
+                            extracted_bits.append(0)
                         else:
-                            extracted_bits.append('1')
+                            extracted_bits.append(1)
                 
                 if len(extracted_bits) > 0:
-                    all_extractions.append("".join(extracted_bits))
-        
-        # Try to decode from all extractions
-        candidates = []
+                    all_extractions.append((offset_y * self.block_size + offset_x,
+                                            np.array(extracted_bits, dtype=np.uint8)))
         
-        for bit_stream in all_extractions:
-            # Find SYNC
-            sync_matches = [m.start() for m in re.finditer(self.SYNC_CODE, bit_stream)]
-            
-            for sync_pos in sync_matches:
-                msg_start = sync_pos + len(self.SYNC_CODE)
-                
-                # Read until we hit terminator or run out
-                for end in range(msg_start + 8, min(len(bit_stream), msg_start + 400), 8):
-                    chunk = bit_stream[msg_start:end]
-                    
-                    # Check for terminator
-                    if chunk.endswith('00000000'):
-                        msg_bits = chunk[:-8]
-                        
-                        # Convert to text
-                        try:
-                            chars = []
-                            for k in range(0, len(msg_bits), 8):
-                                byte = msg_bits[k:k+8]
-                                char_code = int(byte, 2)
-                                if 32 <= char_code <= 126:
-                                    chars.append(chr(char_code))
-                                else:
-                                    break
-                            
-                            if len(chars) >= 3:  # Min length filter
-                                candidates.append("".join(chars))
-                                break
-                        except:
-                            pass
-
-        if candidates:
-            # Return most common
-            most_common = Counter(candidates).most_common(1)
-            return most_common[0][0], None
+        return all_extractions
+
+class _SyncScanner:
+    """
+    Incremental SYNC/payload search over one grid offset's bit stream, fed in
+    chunks. Gives the same candidates as searching the whole stream at once.
+
+    In soft mode, payloads are not parsed; instead the soft values following
+    each hit are summed per bit position. soft_sum/soft_count only take bits
+    from the hit's own block row: after a crop, the next row continues a
+    different part of the packet. wrap_sum/wrap_count also follow the stream
+    across rows, which is only right when the width was not cropped.
+    """
+    def __init__(self, decoder, soft=False, row_blocks=None):
+        self.decoder = decoder
+        self.sync_len = len(decoder.SYNC_CODE)
+        # Bits needed from a hit's start before its candidate is final
+        self.window = self.sync_len + 8 * ((decoder.max_payload_bits - 1) // 8) + 1
+        self.buffer = np.zeros(0, dtype=np.uint8)
+        self.base = 0  # Stream position of buffer[0]
+        self.next_free = 0  # Hits overlapping an earlier hit are skipped
+        self.hits = 0
+        self.hit_positions = []
+        self.soft = np.zeros(0, dtype=np.float32) if soft else None
+        self.row_blocks = row_blocks
+        self.soft_sum = np.zeros(self.window - 1)
+        self.soft_count = np.zeros(self.window - 1)
+        self.wrap_sum = np.zeros(self.window - 1)
+        self.wrap_count = np.zeros(self.window - 1)
+
+    def feed(self, bits, soft=None):
+        self.buffer = np.concatenate([self.buffer, bits])
+        if self.soft is not None:
+            self.soft = np.concatenate([self.soft, soft])
+        return self._scan(final=False)
+
+    def finish(self):
+        return self._scan(final=True)
+
+    def _scan(self, final):
+        buf = self.buffer
+        limit = len(buf) if final else len(buf) - self.window + 1
+        if limit <= 0:
+            return np.zeros((0, 0), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+
+        hits = self.decoder._sync_hits(buf[:limit + self.sync_len - 1])
+        kept = []
+        for pos in (hits + self.base).tolist():
+            if pos >= self.next_free:
+                kept.append(pos - self.base)
+                self.next_free = pos + self.sync_len
+        kept = np.array(kept, dtype=np.int64)
+        self.hits += len(kept)
+        self.decoder.instrument.count('sync_hits', len(kept))
+        if self.soft is not None:
+            self.hit_positions.extend((kept + self.base).tolist())
+
+        if self.soft is not None:
+            if len(kept):
+                self._accumulate(kept)
+            payloads, positions = np.zeros((0, 0), dtype=np.uint8), np.zeros(0, dtype=np.int64)
         else:
-            return None, "No watermark detected."
+            payloads, valid = self.decoder._payloads_at(buf, kept)
+            positions = kept[valid] + self.base
+
+        if not final:
+            self.buffer = buf[limit:]
+            self.base += limit
+            if self.soft is not None:
+                self.soft = self.soft[limit:]
+        return payloads, positions
+
+    def _accumulate(self, hits):
+        span = len(self.soft_sum)
+        padded = np.concatenate([self.soft, np.zeros(span, dtype=np.float32)])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, span)[hits]
+        available = len(self.soft) - hits
+        self.wrap_sum += windows.sum(axis=0)
+        self.wrap_count += (np.arange(span) < available[:, None]).sum(axis=0)
+
+        if self.row_blocks:
+            available = np.minimum(available, self.row_blocks - (hits + self.base) % self.row_blocks)
+        in_row = np.arange(span) < available[:, None]
+        self.soft_sum += (windows * in_row).sum(axis=0)
+        self.soft_count += in_row.sum(axis=0)
+
+class _VoteTally:
+    """Running vote over candidate texts; ties go to the earliest (offset, position)."""
+    def __init__(self, instrument=_NO_INSTRUMENTATION):
+        self.counts = {}
+        self.first_seen = {}
+        self.total = 0
+        self.instrument = instrument
+
+    def add(self, payloads, offset_key, positions):
+        if not len(payloads):
+            return
+        with self.instrument.stage('vote'):
+            for row, pos in zip(payloads, positions.tolist()):
+                key = row.tobytes()
+                self.counts[key] = self.counts.get(key, 0) + 1
+                order = (offset_key, pos)
+                if key not in self.first_seen or order < self.first_seen[key]:
+                    self.first_seen[key] = order
+            self.total += len(payloads)
+        self.instrument.count('votes', len(payloads))
+
+    def leader(self):
+        """(text, votes, runner-up votes) of the current winner, or (None, 0, 0)."""
+        if not self.counts:
+            return None, 0, 0
+        ranked = sorted(self.counts, key=lambda k: (-self.counts[k], self.first_seen[k]))
+        runner_up = self.counts[ranked[1]] if len(ranked) > 1 else 0
+        text = ranked[0].rstrip(b'\x00').decode('ascii')
+        return text, self.counts[ranked[0]], runner_up
+
+    def is_decisive(self, vote_margin, min_confidence):
+        text, votes, runner_up = self.leader()
+        return text is not None and votes - runner_up >= vote_margin and votes / self.total >= min_confidence